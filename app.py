@@ -25,6 +25,12 @@ if 'document_text' not in st.session_state:
     st.session_state['document_text'] = None
 if 'document_name' not in st.session_state:
     st.session_state['document_name'] = None
+if 'document_key' not in st.session_state:
+    st.session_state['document_key'] = None
+if 'document_preview' not in st.session_state:
+    st.session_state['document_preview'] = None
+if 'document_hash' not in st.session_state:
+    st.session_state['document_hash'] = None
 if 'current_summary' not in st.session_state:
     st.session_state['current_summary'] = None
 # Les états pour le chat et le quiz sont initialisés dans leurs modules respectifs
@@ -52,19 +58,24 @@ with st.sidebar:
     if uploaded_file is not None:
         # Vérifier si c'est un nouveau fichier ou le même fichier rechargé
         # (Streamlit recharge souvent, il faut une logique pour éviter les retraitements inutiles)
-        # Une façon simple est de comparer le nom et la taille, mais pas infaillible.
-        # On peut stocker l'ID du fichier uploadé si disponible.
-        # Pour l'instant, on re-extrait si uploaded_file n'est pas None.
+        # On compare une clé (nom, taille, empreinte du contenu) plutôt que le seul nom :
+        # un fichier identique rechargé ne relance ni l'extraction ni la réinitialisation des états.
         new_doc_name = uploaded_file.name
-        if new_doc_name != st.session_state.get('document_name', None):
+        new_doc_key = loader.get_document_key(uploaded_file)
+        if new_doc_key != st.session_state.get('document_key', None):
             st.info("Nouveau document détecté. Extraction du texte...", icon="🔄")
             extracted_text = loader.extract_text_from_uploaded_file(uploaded_file)
             if extracted_text:
                 st.session_state['document_text'] = extracted_text
                 st.session_state['document_name'] = new_doc_name
+                st.session_state['document_key'] = new_doc_key
+                st.session_state['document_preview'] = extracted_text[:2000] + "..." # Aperçu calculé une seule fois
+                # Empreinte du texte complet, calculée une seule fois : clé des caches d'analyse et du chat
+                st.session_state['document_hash'] = utils.content_hash(extracted_text)
                 # Réinitialiser les éléments dérivés du texte précédent
                 st.session_state['current_summary'] = None
                 chatbot.clear_chat_history() # Effacer l'historique du chat lié au doc précédent
+                chatbot.prepare_document_context(extracted_text, text_hash=st.session_state['document_hash']) # Contexte du chat calculé une seule fois
                 quiz.reset_quiz_state() # Réinitialiser le quiz
                 if 'analysis_results' in st.session_state: del st.session_state['analysis_results']
                 st.success("Document traité. Vous pouvez utiliser les fonctionnalités.", icon="👍")
@@ -73,6 +84,10 @@ with st.sidebar:
                 # Si l'extraction échoue pour le nouveau fichier
                 st.session_state['document_text'] = None
                 st.session_state['document_name'] = None
+                st.session_state['document_key'] = None
+                st.session_state['document_preview'] = None
+                st.session_state['document_hash'] = None
+                chatbot.prepare_document_context(None)
                 st.error("Échec de l'extraction du texte du nouveau document.", icon="❌")
         # else:
             # st.info("Le même document est toujours chargé.", icon="📄") # Optionnel
@@ -80,11 +95,16 @@ with st.sidebar:
     # Afficher un aperçu du texte chargé (s'il existe)
     if st.session_state.get('document_text', None):
         with st.expander("Aperçu du Texte Extrait", expanded=False):
-            st.text_area("Contenu", st.session_state['document_text'][:2000] + "...", height=150, key="text_preview_sidebar", disabled=True)
+            st.text_area("Contenu", st.session_state['document_preview'], height=150, key="text_preview_sidebar", disabled=True)
     else:
         st.info("Aucun document chargé ou texte extrait.")
 
     st.markdown("---")
+    st.toggle(
+        "Ignorer le cache IA",
+        key=gemini_client.BYPASS_CACHE_KEY,
+        help="Force une nouvelle génération par Gemini au lieu de réutiliser une réponse déjà obtenue pour la même demande."
+    )
     # Ajouter d'autres options globales dans la sidebar si besoin
     # st.selectbox("Modèle Gemini", config.AVAILABLE_MODELS) # Si on veut laisser choisir le modèle
     # st.slider("Température IA", 0.0, 1.0, 0.7) # Paramètres globaux IA
@@ -109,13 +129,15 @@ doc_name = st.session_state.get('document_name', "document") # Nom par défaut p
 # --- Onglet Résumé ---
 with tab_summary:
     st.markdown("## Génération de Résumé")
-    level, keywords, summarize_pressed = summarizer.display_summarizer_options(text_available=text_ready)
+    level, keywords, compress, summarize_pressed = summarizer.display_summarizer_options(text_available=text_ready)
 
     if summarize_pressed and text_ready:
         summary = summarizer.generate_summary(
             text=doc_text,
             level=level,
-            keywords=keywords
+            keywords=keywords,
+            text_hash=st.session_state['document_hash'],
+            compress=compress
             # model_name=st.session_state.get('selected_model', config.DEFAULT_TEXT_MODEL_NAME) # Si modèle sélectionnable
         )
         if summary:
@@ -143,7 +165,7 @@ with tab_summary:
 # --- Onglet Chat Contextuel ---
 with tab_chat:
     st.markdown("## Conversation avec l'IA")
-    chatbot.display_chat_interface(document_context=doc_text)
+    chatbot.display_chat_interface(document_available=text_ready)
     # Option d'export de l'historique du chat ? (exporter.py)
 
 
@@ -153,12 +175,9 @@ with tab_quiz:
     num_q, q_type, q_diff, generate_pressed = quiz.display_quiz_options(text_available=text_ready)
 
     if generate_pressed and text_ready:
-        questions = quiz.generate_quiz_questions(doc_text, num_q, q_type, q_diff)
+        questions = quiz.generate_quiz_questions(doc_text, num_q, q_type, q_diff, text_hash=st.session_state['document_hash'])
         if questions:
-            st.session_state[quiz.QUIZ_QUESTIONS_KEY] = questions
-            # Ajouter le type à chaque question pour référence facile
-            for q in st.session_state[quiz.QUIZ_QUESTIONS_KEY]:
-                q['type'] = quiz.detect_quiz_type(q)
+            st.session_state[quiz.QUIZ_QUESTIONS_KEY] = questions # Chaque question porte déjà son 'type'
             st.session_state[quiz.QUIZ_GENERATED_KEY] = True
             st.session_state[quiz.QUIZ_CURRENT_QUESTION_KEY] = 0 # Démarrer à la première question
             st.rerun() # Recharger pour afficher l'interface du quiz
@@ -178,7 +197,8 @@ with tab_quiz:
 # --- Onglet Analyse & Insights ---
 with tab_analysis:
     st.markdown("## Analyse du Document")
-    analyzer.display_analysis_interface(text_available=text_ready, document_text=doc_text)
+    analyzer.display_analysis_interface(text_available=text_ready, document_text=doc_text,
+                                        document_hash=st.session_state.get('document_hash'))
 
 # --- Pied de page (Optionnel) ---
 st.markdown("---")
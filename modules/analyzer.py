@@ -1,17 +1,24 @@
 import streamlit as st
-import matplotlib.pyplot as plt
-from wordcloud import WordCloud, STOPWORDS
 import io
 from collections import Counter
+import functools
 import re
+import threading
+import orjson
 
 # Importer le client Gemini si l'extraction de mots-clés se fait via l'IA
 from . import gemini_client
 from . import config
 from . import utils
 
+# Ponctuation à remplacer par un espace (compilée une seule fois pour tous les appels)
+_PUNCT_RE = re.compile(r'[^\w\s]+')
+
+# Note : wordcloud, pandas, numpy et numba sont importés à la demande (dans les fonctions)
+# pour ne pas ralentir le démarrage de l'application si l'onglet Analyse n'est pas utilisé.
+
 # Mots vides supplémentaires courants en français (à compléter)
-FRENCH_STOPWORDS = set(STOPWORDS) | {
+_FRENCH_EXTRA_STOPWORDS = frozenset({
     'le', 'la', 'les', 'un', 'une', 'des', 'du', 'de', 'à', 'et', 'est', 'il', 'elle',
     'on', 'nous', 'vous', 'ils', 'elles', 'ce', 'cet', 'cette', 'ces', 'mon', 'ma',
     'mes', 'ton', 'ta', 'tes', 'son', 'sa', 'ses', 'notre', 'nos', 'votre', 'vos',
@@ -30,15 +37,100 @@ FRENCH_STOPWORDS = set(STOPWORDS) | {
     'article', 'chapitre', 'selon', 'suite', 'figure', 'tableau', 'exemple', 'partie',
     'cas', 'a', 'b', 'c', 'd', 'e', 'f', 'g', 'h', 'i', 'j', 'k', 'l', 'm', 'n', 'o',
     'p', 'q', 'r', 's', 't', 'u', 'v', 'w', 'x', 'y', 'z'
-}
+})
+
+
+@functools.cache
+def _french_stopwords() -> frozenset[str]:
+    """Mots vides anglais de wordcloud + mots vides français (calculés au premier appel)."""
+    from wordcloud import STOPWORDS
+    return frozenset(STOPWORDS) | _FRENCH_EXTRA_STOPWORDS
+
+
+@functools.cache
+def _get_text_kernels():
+    """Noyau Numba optionnel pour le comptage de mots (None si numba n'est pas installé)."""
+    try:
+        from . import text_kernels
+    except ImportError:
+        return None
+    return text_kernels
+
+
+@functools.cache
+def _stop_hashes():
+    """Hashes des mots vides pour le noyau Numba (calculés une seule fois)."""
+    return _get_text_kernels().build_stop_hashes(_french_stopwords())
+
+# Nombre de caractères du début du document envoyés à Gemini pour l'extraction de mots-clés
+KEYWORDS_CONTEXT_CHARS = 8000
+# Schéma de la réponse structurée attendue de Gemini : une liste JSON de chaînes
+KEYWORDS_RESPONSE_SCHEMA = {"type": "array", "items": {"type": "string"}}
+
+# L'instance WordCloud est partagée entre les sessions : generate_from_frequencies() modifie son état interne
+_WORDCLOUD_LOCK = threading.Lock()
+
+
+@st.cache_data(show_spinner="Prétraitement du texte...", max_entries=8)
+def _count_words_cached(text_hash: str, _text: str):
+    """
+    Tokenise le texte et compte les mots significatifs, une seule fois par document.
+    Partagé par le nuage de mots et l'analyse de fréquence (le texte est exclu du hachage).
+
+    Returns:
+        tuple: (mots uniques dans l'ordre de première apparition, np.ndarray int64 des occurrences).
+    """
+    import numpy as np
+
+    text_kernels = _get_text_kernels()
+    if text_kernels is not None:
+        # Tokenisation, filtrage et comptage compilés (Numba) sur le buffer UTF-8
+        return text_kernels.count_words(_text, _stop_hashes())
+
+    # Prétraitement : minuscules, ponctuation remplacée par des espaces, séparation mots
+    words = _PUNCT_RE.sub(' ', _text.lower()).split()
+
+    # Compter d'abord tous les mots (boucle en C de Counter), puis filtrer le vocabulaire :
+    # les tests de longueur et de mots vides se font une fois par mot distinct, pas par occurrence.
+    # L'ordre de première apparition est conservé, donc les ex-aequo restent départagés pareil.
+    stopwords = _french_stopwords()
+    raw_counts = Counter(words)
+    word_counts = {word: count for word, count in raw_counts.items()
+                   if len(word) > 2 and word not in stopwords}
+    return list(word_counts), np.fromiter(word_counts.values(), dtype=np.int64, count=len(word_counts))
+
+
+def _most_common(words: list[str], counts, n: int) -> list[tuple[str, int]]:
+    """
+    Retourne les n mots les plus fréquents (comme Counter.most_common, ex-aequo dans l'ordre d'apparition).
+
+    Args:
+        words (list[str]): Mots uniques dans l'ordre de première apparition.
+        counts (np.ndarray): Occurrences de chaque mot.
+        n (int): Le nombre de mots à retourner.
+
+    Returns:
+        list[tuple[str, int]]: Liste de tuples (mot, fréquence), du plus fréquent au moins fréquent.
+    """
+    import numpy as np
+
+    candidates = np.arange(counts.shape[0])
+    if 0 < n < counts.shape[0]:
+        # Sélection en O(V) du seuil du top-N, puis tri des seuls candidats (ex-aequo inclus)
+        threshold = np.partition(counts, counts.shape[0] - n)[counts.shape[0] - n]
+        candidates = np.flatnonzero(counts >= threshold)
+    # Tri stable : à fréquence égale, l'ordre de première apparition est conservé (comme Counter)
+    top = candidates[np.argsort(-counts[candidates], kind='stable')][:n]
+    return [(words[i], int(counts[i])) for i in top.tolist()]
 
 
-# @st.cache_data(show_spinner="Extraction des mots-clés par l'IA...")
 def extract_keywords_with_gemini(text: str,
                                  num_keywords: int = 10,
                                  model_name: str = config.DEFAULT_TEXT_MODEL_NAME) -> list[str] | None:
     """
     Extrait les mots-clés principaux d'un texte en utilisant Gemini.
+    Seul le début du texte (KEYWORDS_CONTEXT_CHARS caractères) est envoyé au modèle : le résultat
+    est mis en cache sur l'empreinte de ce seul extrait, sans hacher le document complet.
 
     Args:
         text (str): Le texte à analyser.
@@ -52,6 +144,20 @@ def extract_keywords_with_gemini(text: str,
         st.warning("Le texte pour l'extraction de mots-clés est vide.", icon="⚠️")
         return None
 
+    text_head = text[:KEYWORDS_CONTEXT_CHARS]
+    head_hash = utils.content_hash(text_head)
+    keywords = _extract_keywords_cached(head_hash, num_keywords, model_name, text_head)
+    if keywords is None:
+        _extract_keywords_cached.clear(head_hash, num_keywords, model_name, text_head) # Retirer uniquement cet échec du cache
+    return keywords
+
+
+# Le paramètre `_text` (préfixe _) est ignoré par Streamlit pour la clé de cache : seule l'empreinte compte
+@st.cache_data(show_spinner="Extraction des mots-clés par l'IA...", ttl=3600, max_entries=32)
+def _extract_keywords_cached(text_hash: str, num_keywords: int, model_name: str, _text: str) -> list[str] | None:
+    """Appel Gemini pour l'extraction de mots-clés (voir `extract_keywords_with_gemini`)."""
+    text_head = _text # Déjà limité à KEYWORDS_CONTEXT_CHARS caractères
+
     # Vérifier si le client Gemini est prêt
     if not gemini_client.configure_gemini():
          st.error("Impossible d'extraire les mots-clés car le client Gemini n'est pas configuré.", icon="❌")
@@ -63,57 +169,65 @@ def extract_keywords_with_gemini(text: str,
     Ignore les mots courants et concentre-toi sur les termes spécifiques et significatifs.
 
     --- DEBUT DOCUMENT ---
-    {text[:8000]}
+    {text_head}
     --- FIN DOCUMENT ---
 
-    Instructions de formatage :
-    Réponds **UNIQUEMENT** avec une liste de mots-clés séparés par des virgules. N'ajoute AUCUN autre texte, en-tête ou numérotation.
-
-    Exemple de sortie attendue :
-    mot-clé 1, expression clé 2, terme spécifique 3, concept 4, ...
+    Réponds avec la liste des mots-clés (un mot-clé ou une expression par élément).
+    """ # Le format (liste JSON de chaînes) est imposé par le schéma de réponse
 
-    Liste des mots-clés :
-    """ # L'IA devrait continuer après "Liste des mots-clés :"
-
-    # Appeler l'API Gemini
+    # Appeler l'API Gemini (sortie structurée JSON)
     response = gemini_client.generate_text(
         prompt=prompt,
         model_name=model_name,
         temperature=0.3, # Plus factuel pour l'extraction
-        max_output_tokens=256 # Suffisant pour une liste de mots-clés
+        max_output_tokens=256, # Suffisant pour une liste de mots-clés
+        response_schema=KEYWORDS_RESPONSE_SCHEMA
     )
 
     if response:
-        # Nettoyer la réponse : supprimer les en-têtes potentiels et séparer par virgule
-        response = response.strip()
-        # Supprimer une éventuelle ligne d'en-tête restante
-        if response.lower().startswith("liste des mots-clés"):
-            response = response.split(":", 1)[-1].strip()
-        elif response.lower().startswith("voici les mots-clés"):
-             response = response.split(":", 1)[-1].strip()
-
-        # Séparer par virgule et nettoyer chaque mot-clé
-        keywords = [kw.strip() for kw in response.split(',') if kw.strip()]
+        try:
+            parsed = orjson.loads(response)
+        except orjson.JSONDecodeError:
+            parsed = None
+
+        # Nettoyer chaque mot-clé (ignorer les éléments vides ou non textuels)
+        keywords = [kw.strip() for kw in parsed if isinstance(kw, str) and kw.strip()] if isinstance(parsed, list) else []
         if keywords:
             st.success(f"{len(keywords)} mots-clés extraits par l'IA.", icon="🔑")
             return keywords
         else:
              st.warning("L'IA n'a pas retourné de mots-clés dans le format attendu.", icon="🤔")
-             st.text_area("Réponse brute de l'IA (Mots-clés)", response, height=100)
+             st.code(response, language=None) # Réponse brute de l'IA (pas de widget dans une fonction en cache)
              return None
     else:
         st.error("L'extraction des mots-clés par l'IA a échoué.", icon="❌")
         return None
 
 
-@st.cache_data(show_spinner="Génération du nuage de mots...")
-def generate_word_cloud(text: str, max_words: int = 100) -> io.BytesIO | None:
+@st.cache_resource(show_spinner=False)
+def _get_wordcloud(max_words: int):
+    """Retourne une instance WordCloud configurée, créée une seule fois par valeur de max_words."""
+    from wordcloud import WordCloud
+    return WordCloud(
+        width=800,
+        height=400,
+        background_color='white',
+        max_words=max_words, # Les fréquences fournies sont déjà filtrées (mots vides, mots courts)
+        contour_width=1,
+        contour_color='steelblue',
+        colormap='viridis' # Choisir une palette de couleurs
+    )
+
+
+def generate_word_cloud(text: str, max_words: int = 100, text_hash: str | None = None) -> io.BytesIO | None:
     """
-    Génère un nuage de mots à partir du texte fourni.
+    Génère un nuage de mots à partir du texte fourni (mis en cache sur l'empreinte du texte).
 
     Args:
         text (str): Le texte source.
         max_words (int): Nombre maximum de mots à afficher dans le nuage.
+        text_hash (str | None): Empreinte du texte (`utils.content_hash`) si elle est déjà connue,
+                                pour éviter de hacher à nouveau tout le document.
 
     Returns:
         io.BytesIO: Un buffer contenant l'image PNG du nuage de mots, ou None si erreur.
@@ -121,33 +235,29 @@ def generate_word_cloud(text: str, max_words: int = 100) -> io.BytesIO | None:
     if not text:
         st.warning("Le texte pour le nuage de mots est vide.", icon="⚠️")
         return None
+    return _generate_word_cloud_cached(text_hash or utils.content_hash(text), max_words, text)
+
 
+@st.cache_data(show_spinner="Génération du nuage de mots...", max_entries=32)
+def _generate_word_cloud_cached(text_hash: str, max_words: int, _text: str) -> io.BytesIO | None:
+    """Génération du nuage de mots (voir `generate_word_cloud`)."""
     try:
-        # Prétraitement simple du texte pour le nuage de mots
-        # Convertir en minuscules et supprimer la ponctuation simple
-        text_processed = re.sub(r'[^\w\s]', '', text.lower())
-
-        wordcloud = WordCloud(
-            width=800,
-            height=400,
-            background_color='white',
-            stopwords=FRENCH_STOPWORDS,
-            max_words=max_words,
-            contour_width=1,
-            contour_color='steelblue',
-            colormap='viridis' # Choisir une palette de couleurs
-        ).generate(text_processed)
-
-        # Créer la figure matplotlib
-        plt.figure(figsize=(10, 5))
-        plt.imshow(wordcloud, interpolation='bilinear')
-        plt.axis('off') # Ne pas afficher les axes
-
-        # Sauvegarder l'image dans un buffer mémoire
+        # Réutiliser le comptage de mots partagé avec l'analyse de fréquence
+        words, counts = _count_words_cached(text_hash, _text)
+        frequencies = dict(_most_common(words, counts, max_words))
+        if not frequencies:
+            st.warning("Aucun mot significatif trouvé pour le nuage de mots.", icon="🤔")
+            return None
+
+        wordcloud = _get_wordcloud(max_words)
+        with _WORDCLOUD_LOCK:
+            image = wordcloud.generate_from_frequencies(frequencies).to_image()
+
+        # Sauvegarder l'image PNG directement dans un buffer mémoire (sans figure matplotlib)
+        # Compression zlib minimale : encodage bien plus rapide, pour un PNG à peine plus lourd
         img_buffer = io.BytesIO()
-        plt.savefig(img_buffer, format='png', bbox_inches='tight')
+        image.save(img_buffer, 'PNG', optimize=False, compress_level=1)
         img_buffer.seek(0) # Rembobiner le buffer pour la lecture
-        plt.close() # Fermer la figure pour libérer la mémoire
 
         st.success("Nuage de mots généré.", icon="☁️")
         return img_buffer
@@ -157,14 +267,15 @@ def generate_word_cloud(text: str, max_words: int = 100) -> io.BytesIO | None:
         return None
 
 
-@st.cache_data(show_spinner="Calcul des fréquences de mots...")
-def get_word_frequencies(text: str, num_top_words: int = 20) -> list[tuple[str, int]] | None:
+def get_word_frequencies(text: str, num_top_words: int = 20, text_hash: str | None = None) -> list[tuple[str, int]] | None:
     """
     Calcule la fréquence des mots les plus courants dans le texte (après filtrage).
+    Le résultat est mis en cache sur l'empreinte du texte.
 
     Args:
         text (str): Le texte source.
         num_top_words (int): Le nombre de mots les plus fréquents à retourner.
+        text_hash (str | None): Empreinte du texte (`utils.content_hash`) si elle est déjà connue.
 
     Returns:
         list[tuple[str, int]]: Une liste de tuples (mot, fréquence), ou None si erreur.
@@ -172,20 +283,18 @@ def get_word_frequencies(text: str, num_top_words: int = 20) -> list[tuple[str,
     if not text:
         st.warning("Le texte pour l'analyse de fréquence est vide.", icon="⚠️")
         return None
+    return _get_word_frequencies_cached(text_hash or utils.content_hash(text), num_top_words, text)
 
-    try:
-        # Prétraitement : minuscules, suppression ponctuation, séparation mots
-        text_processed = re.sub(r'[^\w\s]', '', text.lower())
-        words = text_processed.split()
-
-        # Filtrer les mots vides et les mots trop courts
-        filtered_words = [word for word in words if word not in FRENCH_STOPWORDS and len(word) > 2]
 
-        # Compter les fréquences
-        word_counts = Counter(filtered_words)
+@st.cache_data(show_spinner="Calcul des fréquences de mots...", max_entries=32)
+def _get_word_frequencies_cached(text_hash: str, num_top_words: int, _text: str) -> list[tuple[str, int]] | None:
+    """Calcul des fréquences de mots (voir `get_word_frequencies`)."""
+    try:
+        # Réutiliser le comptage de mots partagé avec le nuage de mots
+        words, counts = _count_words_cached(text_hash, _text)
 
         # Obtenir les N mots les plus fréquents
-        most_common = word_counts.most_common(num_top_words)
+        most_common = _most_common(words, counts, num_top_words)
 
         if most_common:
              st.success(f"Fréquence des {len(most_common)} mots les plus courants calculée.", icon="📊")
@@ -199,13 +308,16 @@ def get_word_frequencies(text: str, num_top_words: int = 20) -> list[tuple[str,
         return None
 
 
-def display_analysis_interface(text_available: bool, document_text: str | None):
+@st.fragment
+def display_analysis_interface(text_available: bool, document_text: str | None, document_hash: str | None = None):
     """
     Affiche l'interface pour les options d'analyse et les résultats.
+    Fragment Streamlit : les interactions avec ses widgets ne relancent que cette fonction.
 
     Args:
         text_available (bool): Indique si du texte est disponible.
         document_text (str | None): Le texte du document chargé.
+        document_hash (str | None): Empreinte du texte calculée au chargement (clé des caches).
     """
     st.subheader("5. Analyse & Insights")
 
@@ -223,19 +335,22 @@ def display_analysis_interface(text_available: bool, document_text: str | None):
     run_analysis_button = st.button("Lancer l'Analyse", key="run_analysis_button", use_container_width=True)
 
     if run_analysis_button:
-        st.session_state['analysis_results'] = {} # Réinitialiser les résultats
-
+        # Les analyses sont indépendantes : l'appel réseau à Gemini (mots-clés) est lancé
+        # en parallèle des calculs locaux (nuage, fréquences) au lieu de les attendre en série.
+        tasks = {}
         if "Extraction Mots-clés (IA)" in analysis_options:
-            keywords = extract_keywords_with_gemini(document_text, num_keywords=15)
-            st.session_state['analysis_results']['keywords'] = keywords if keywords else "Échec de l'extraction"
+            tasks['keywords'] = lambda: extract_keywords_with_gemini(document_text, num_keywords=15)
 
         if "Nuage de Mots" in analysis_options:
-            wordcloud_img = generate_word_cloud(document_text, max_words=100)
-            st.session_state['analysis_results']['wordcloud'] = wordcloud_img
+            tasks['wordcloud'] = lambda: generate_word_cloud(document_text, max_words=100, text_hash=document_hash)
 
         if "Fréquence des Mots" in analysis_options:
-            frequencies = get_word_frequencies(document_text, num_top_words=20)
-            st.session_state['analysis_results']['frequencies'] = frequencies
+            tasks['frequencies'] = lambda: get_word_frequencies(document_text, num_top_words=20, text_hash=document_hash)
+
+        results = utils.run_concurrently(tasks)
+        if 'keywords' in results and not results['keywords']:
+            results['keywords'] = "Échec de l'extraction"
+        st.session_state['analysis_results'] = results # Remplace les résultats précédents
 
     # Afficher les résultats stockés dans session_state
     if 'analysis_results' in st.session_state:
@@ -265,14 +380,16 @@ def display_analysis_interface(text_available: bool, document_text: str | None):
                 df_freq = pd.DataFrame(freq_data, columns=['Mot', 'Fréquence'])
                 st.dataframe(df_freq, use_container_width=True, hide_index=True)
 
-                # Optionnel : petit graphique à barres
-                fig, ax = plt.subplots(figsize=(10, 5))
-                ax.barh(df_freq['Mot'], df_freq['Fréquence'], color='skyblue')
-                ax.invert_yaxis() # Afficher le plus fréquent en haut
-                ax.set_title('Top Mots par Fréquence')
-                ax.set_xlabel('Fréquence')
-                st.pyplot(fig)
-                plt.close(fig) # Fermer la figure
+                # Optionnel : petit graphique à barres (rendu côté navigateur par Vega-Lite,
+                # sans figure matplotlib ni image PNG générée sur le serveur)
+                st.bar_chart(
+                    df_freq,
+                    x='Mot',
+                    y='Fréquence',
+                    horizontal=True,
+                    sort='-Fréquence', # Afficher le plus fréquent en haut
+                    color='#87CEEB', # skyblue
+                )
 
             except ImportError:
                  st.warning("La bibliothèque Pandas est nécessaire pour afficher le tableau des fréquences. Veuillez l'installer (`pip install pandas`).", icon="⚠️")
@@ -1,4 +1,6 @@
 import streamlit as st
+from collections import deque
+from collections.abc import Iterator
 from . import gemini_client
 from . import config
 from . import utils
@@ -7,19 +9,54 @@ from . import utils
 CHAT_HISTORY_KEY = "gemini_chat_history"
 # Clé pour stocker l'instance de chat si l'API le supporte
 CHAT_SESSION_KEY = "gemini_chat_session"
+# Clé pour stocker le contexte du document préparé au chargement (voir prepare_document_context)
+CHAT_CONTEXT_KEY = "gemini_chat_context"
 
-# Limite de caractères du document à injecter dans le contexte du chat
-# Augmentée, mais attention aux limites réelles du modèle utilisé !
-# Les modèles comme Gemini 1.5 Pro ont des fenêtres de contexte beaucoup plus grandes,
-# mais gemini-1.5-flash ou gemini-1.0-pro sont plus limités.
-# Une valeur comme 15000 est un compromis. Pour des documents très volumineux,
-# une approche RAG serait nécessaire.
-MAX_CONTEXT_LENGTH = 15000
+# Budget de tokens du document à injecter dans le contexte du chat
+# Le nombre de caractères est un mauvais indicateur du coût réel (les tokens facturés et
+# la latence de Gemini dépendent du nombre de tokens en entrée) : on tronque donc selon
+# le tokenizer du modèle. 4000 tokens correspondent à peu près aux 15000 caractères
+# utilisés auparavant. Pour des documents très volumineux, une approche RAG serait nécessaire.
+MAX_CONTEXT_TOKENS = 4000
+# Nombre moyen de caractères par token, utilisé si le comptage via l'API échoue
+CHARS_PER_TOKEN_ESTIMATE = 4
+# Un token dépasse rarement 8 caractères : inutile de mesurer au-delà de cette borne
+MAX_CHARS_PER_TOKEN = 8
+
+# Nombre de messages conservés dans l'historique (fenêtre glissante : 10 échanges).
+# Borne le coût de construction du prompt et le nombre de tokens envoyés à chaque tour.
+MAX_HISTORY_MESSAGES = 20
+
+# Instructions système du chat (partie fixe du prompt)
+SYSTEM_PROMPT = "Tu es un assistant IA expert dans l'analyse de documents. Réponds aux questions de l'utilisateur en te basant PRÉCISÉMENT et UNIQUEMENT sur le contexte du document fourni ci-dessous et l'historique de la conversation. Si l'information demandée n'est pas explicitement présente dans le document, indique que tu ne peux pas répondre avec les informations fournies. Ne spécule pas et ne cherche pas d'informations externes."
+
+def build_prompt_prefix(context: str | None) -> str:
+    """
+    Construit la partie statique du prompt (instructions + contexte du document).
+    Elle ne dépend que du document : elle est calculée une fois par document.
+
+    Args:
+        context (str | None): Le contexte (tronqué) du document, ou None si aucun document.
+
+    Returns:
+        str: Le préfixe du prompt.
+    """
+    if context:
+        return "\n".join((
+            SYSTEM_PROMPT,
+            "\n--- CONTEXTE DU DOCUMENT (Baser la réponse sur ce texte) ---",
+            context,
+            "--- FIN DU CONTEXTE DU DOCUMENT ---",
+        ))
+    return "\n".join((SYSTEM_PROMPT, "\n[INFO] Aucun document n'est chargé pour fournir un contexte."))
+
+# Préfixe utilisé lorsqu'aucun document n'est chargé
+_NO_DOCUMENT_PROMPT_PREFIX = build_prompt_prefix(None)
 
 def initialize_chat():
     """Initialise l'historique du chat dans st.session_state si nécessaire."""
     if CHAT_HISTORY_KEY not in st.session_state:
-        st.session_state[CHAT_HISTORY_KEY] = []
+        st.session_state[CHAT_HISTORY_KEY] = deque(maxlen=MAX_HISTORY_MESSAGES)
 
 def display_chat_history():
     """Affiche l'historique de la conversation dans l'interface Streamlit."""
@@ -39,18 +76,124 @@ def add_message_to_history(role: str, content: str):
 
 def clear_chat_history():
     """Efface l'historique du chat."""
-    st.session_state[CHAT_HISTORY_KEY] = []
+    st.session_state[CHAT_HISTORY_KEY] = deque(maxlen=MAX_HISTORY_MESSAGES)
     st.success("Historique du chat effacé.", icon="🧹")
 
+def get_truncated_context(document_context: str,
+                          max_tokens: int = MAX_CONTEXT_TOKENS,
+                          model_name: str = config.DEFAULT_TEXT_MODEL_NAME,
+                          text_hash: str | None = None) -> tuple[str, int, bool]:
+    """
+    Tronque le contexte du document au budget de tokens (calcul mis en cache par document).
+
+    Args:
+        document_context (str): Le texte du document.
+        max_tokens (int): Le nombre maximum de tokens à conserver.
+        model_name (str): Le nom du modèle dont le tokenizer est utilisé.
+        text_hash (str | None): Empreinte du texte (`utils.content_hash`) si elle est déjà connue.
+
+    Returns:
+        tuple: (contexte tronqué, nombre de tokens estimé, True si le document a été tronqué).
+    """
+    return _truncate_context_cached(text_hash or utils.content_hash(document_context), max_tokens, model_name, document_context)
+
+@st.cache_data(show_spinner=False, max_entries=32)
+def _truncate_context_cached(text_hash: str, max_tokens: int, model_name: str, _text: str) -> tuple[str, int, bool]:
+    # Le texte est exclu du hachage de Streamlit (préfixe '_') : la clé est son empreinte
+    # Pré-découpe bornée : évite d'envoyer un document entier au tokenizer
+    candidate = _text[:max_tokens * MAX_CHARS_PER_TOKEN]
+    num_tokens = gemini_client.count_tokens(candidate, model_name)
+    if num_tokens is None:
+        num_tokens = len(candidate) // CHARS_PER_TOKEN_ESTIMATE
+
+    if num_tokens > max_tokens:
+        # Réduire au prorata du ratio caractères/tokens observé sur ce document, puis re-mesurer
+        candidate = candidate[:int(len(candidate) * max_tokens / num_tokens)]
+        num_tokens = gemini_client.count_tokens(candidate, model_name) or len(candidate) // CHARS_PER_TOKEN_ESTIMATE
+
+    return candidate, num_tokens, len(candidate) < len(_text)
+
+def prepare_document_context(document_text: str | None,
+                             model_name: str = config.DEFAULT_TEXT_MODEL_NAME,
+                             text_hash: str | None = None):
+    """
+    Prépare une seule fois, au chargement du document, le contexte injecté dans le chat.
+    Le contexte tronqué est stocké dans st.session_state : les tours de conversation
+    n'ont plus à mesurer ni à découper le document complet.
+
+    Args:
+        document_text (str | None): Le texte du document chargé (None pour effacer le contexte).
+        model_name (str): Le nom du modèle Gemini dont le tokenizer est utilisé.
+        text_hash (str | None): Empreinte du texte (`utils.content_hash`) si elle est déjà connue.
+    """
+    if not document_text:
+        st.session_state.pop(CHAT_CONTEXT_KEY, None)
+        return
+
+    context, context_tokens, was_truncated = get_truncated_context(document_text, model_name=model_name, text_hash=text_hash)
+    st.session_state[CHAT_CONTEXT_KEY] = {
+        "text": context,
+        "tokens": context_tokens,
+        "was_truncated": was_truncated,
+        "prompt_prefix": build_prompt_prefix(context), # Partie statique du prompt, construite une fois
+    }
+
+    if was_truncated:
+        # Informer l'utilisateur (une seule fois) que seul le début du document est utilisé
+        st.warning(
+            f"Le document est très long ({len(document_text)} caractères). "
+            f"Seuls les {len(context)} premiers caractères (environ {context_tokens} tokens) seront utilisés comme contexte pour le chat afin d'éviter les erreurs et de respecter les limites de l'IA. "
+            "Pour une analyse complète de documents très volumineux, des techniques plus avancées (non implémentées ici) seraient nécessaires.",
+            icon="⚠️"
+        )
+
+# Paramètres de génération du chat
+CHAT_TEMPERATURE = 0.2 # Température modérée pour rester factuel mais fluide
+CHAT_MAX_OUTPUT_TOKENS = 2500 # Augmenter un peu si nécessaire
+
+def build_chat_prompt(user_input: str) -> str:
+    """
+    Construit le prompt complet d'un tour de conversation à partir du contexte
+    préparé au chargement du document (voir `prepare_document_context`) et de l'historique.
+
+    Args:
+        user_input (str): La dernière question ou message de l'utilisateur.
+
+    Returns:
+        str: Le prompt à envoyer au modèle.
+    """
+    # Partie statique (instructions + contexte du document), préparée au chargement du document
+    document_context = st.session_state.get(CHAT_CONTEXT_KEY)
+    prompt_prefix = document_context["prompt_prefix"] if document_context else _NO_DOCUMENT_PROMPT_PREFIX
+
+    # Ajouter l'historique de la conversation (format simple, fenêtre bornée à MAX_HISTORY_MESSAGES)
+    history = st.session_state.get(CHAT_HISTORY_KEY)
+    if history:
+        history_str = "\n".join(
+            f"{'Utilisateur' if msg['role'] == 'user' else 'Assistant'}: {msg['content']}" for msg in history
+        )
+    else:
+        history_str = "(Début de la conversation)"
+
+    return "\n".join((
+        prompt_prefix,
+        "\n--- HISTORIQUE DE LA CONVERSATION ---",
+        history_str,
+        "--- FIN DE L'HISTORIQUE ---",
+        # Ajouter la dernière question de l'utilisateur
+        f"\nUtilisateur: {user_input}",
+        # Indiquer à l'IA où commencer sa réponse et rappeler l'instruction clé
+        "\nAssistant (Répondre en se basant **uniquement** sur le contexte fourni):",
+    ))
+
 def get_chat_response(user_input: str,
-                      document_context: str | None,
                       model_name: str = config.DEFAULT_TEXT_MODEL_NAME) -> str | None:
     """
-    Obtient une réponse du chatbot Gemini en utilisant l'historique et le contexte.
+    Obtient une réponse du chatbot Gemini en utilisant l'historique et le contexte
+    préparé au chargement du document (voir `prepare_document_context`).
 
     Args:
         user_input (str): La dernière question ou message de l'utilisateur.
-        document_context (str | None): Le texte du document à utiliser comme contexte.
         model_name (str): Le nom du modèle Gemini à utiliser.
 
     Returns:
@@ -63,58 +206,12 @@ def get_chat_response(user_input: str,
          st.error("Impossible d'obtenir une réponse car le client Gemini n'est pas configuré.", icon="❌")
          return None
 
-    prompt_parts = []
-    prompt_parts.append("Tu es un assistant IA expert dans l'analyse de documents. Réponds aux questions de l'utilisateur en te basant PRÉCISÉMENT et UNIQUEMENT sur le contexte du document fourni ci-dessous et l'historique de la conversation. Si l'information demandée n'est pas explicitement présente dans le document, indique que tu ne peux pas répondre avec les informations fournies. Ne spécule pas et ne cherche pas d'informations externes.")
-
-    # Ajouter le contexte du document (s'il existe)
-    if document_context:
-        context_to_inject = document_context
-        if len(document_context) > MAX_CONTEXT_LENGTH:
-             # Tronquer le contexte et informer l'utilisateur plus clairement
-             truncated_context = document_context[:MAX_CONTEXT_LENGTH]
-             st.warning(
-                 f"Le document est très long ({len(document_context)} caractères). "
-                 f"Seuls les {MAX_CONTEXT_LENGTH} premiers caractères seront utilisés comme contexte pour cette conversation afin d'éviter les erreurs et de respecter les limites de l'IA. "
-                 "Pour une analyse complète de documents très volumineux, des techniques plus avancées (non implémentées ici) seraient nécessaires.",
-                 icon="⚠️"
-             )
-             context_to_inject = truncated_context
-        else:
-             # Optionnel : informer que tout le contexte est utilisé
-             # st.info(f"Utilisation du contexte complet du document ({len(document_context)} caractères).", icon="ℹ️")
-             pass
-
-        prompt_parts.append("\n--- CONTEXTE DU DOCUMENT (Baser la réponse sur ce texte) ---")
-        prompt_parts.append(context_to_inject)
-        prompt_parts.append("--- FIN DU CONTEXTE DU DOCUMENT ---")
-
-    else:
-         prompt_parts.append("\n[INFO] Aucun document n'est chargé pour fournir un contexte.")
-
-
-    # Ajouter l'historique de la conversation (format simple)
-    prompt_parts.append("\n--- HISTORIQUE DE LA CONVERSATION ---")
-    if CHAT_HISTORY_KEY in st.session_state and st.session_state[CHAT_HISTORY_KEY]:
-        for msg in st.session_state[CHAT_HISTORY_KEY]:
-            role_prefix = "Utilisateur" if msg["role"] == "user" else "Assistant"
-            prompt_parts.append(f"{role_prefix}: {msg['content']}")
-    else:
-        prompt_parts.append("(Début de la conversation)")
-    prompt_parts.append("--- FIN DE L'HISTORIQUE ---")
-
-    # Ajouter la dernière question de l'utilisateur
-    prompt_parts.append(f"\nUtilisateur: {user_input}")
-    # Indiquer à l'IA où commencer sa réponse et rappeler l'instruction clé
-    prompt_parts.append("\nAssistant (Répondre en se basant **uniquement** sur le contexte fourni):")
-
-    full_prompt = "\n".join(prompt_parts)
-
     # Appeler l'API Gemini
     response = gemini_client.generate_text(
-        prompt=full_prompt,
+        prompt=build_chat_prompt(user_input),
         model_name=model_name,
-        temperature=0.2, # Température modérée pour rester factuel mais fluide
-        max_output_tokens=2500 # Augmenter un peu si nécessaire
+        temperature=CHAT_TEMPERATURE,
+        max_output_tokens=CHAT_MAX_OUTPUT_TOKENS
     )
 
     if response:
@@ -122,18 +219,48 @@ def get_chat_response(user_input: str,
     else:
         return None
 
-def display_chat_interface(document_context: str | None):
+def stream_chat_response(user_input: str,
+                         model_name: str = config.DEFAULT_TEXT_MODEL_NAME) -> Iterator[str]:
+    """
+    Variante de `get_chat_response` en streaming, à passer à st.write_stream :
+    la réponse s'affiche dès les premiers tokens reçus.
+
+    Args:
+        user_input (str): La dernière question ou message de l'utilisateur.
+        model_name (str): Le nom du modèle Gemini à utiliser.
+
+    Yields:
+        str: Les morceaux successifs de la réponse (rien en cas d'erreur).
+    """
+    if not user_input:
+        return
+
+    if not gemini_client.configure_gemini():
+         st.error("Impossible d'obtenir une réponse car le client Gemini n'est pas configuré.", icon="❌")
+         return
+
+    yield from gemini_client.generate_text_stream(
+        prompt=build_chat_prompt(user_input),
+        model_name=model_name,
+        temperature=CHAT_TEMPERATURE,
+        max_output_tokens=CHAT_MAX_OUTPUT_TOKENS
+    )
+
+@st.fragment
+def display_chat_interface(document_available: bool):
     """
     Affiche l'interface complète du chat dans Streamlit.
+    Fragment Streamlit : un message envoyé ne relance que l'interface du chat, pas toute l'application.
+    Le contexte du document est lu depuis st.session_state (voir `prepare_document_context`).
 
     Args:
-        document_context (str | None): Le texte du document chargé.
+        document_available (bool): Indique si un document est chargé.
     """
     st.subheader("3. Chat Contextuel")
 
     initialize_chat()
 
-    chat_enabled = bool(document_context)
+    chat_enabled = document_available and CHAT_CONTEXT_KEY in st.session_state
     if not chat_enabled:
         st.info("Chargez un document pour démarrer une conversation contextuelle.", icon="📄")
 
@@ -157,29 +284,23 @@ def display_chat_interface(document_context: str | None):
              with st.chat_message("user"):
                  st.markdown(user_input)
 
-        # 2. Obtenir la réponse de l'IA
-        with st.spinner("L'assistant réfléchit..."):
-            ai_response = get_chat_response(user_input, document_context)
-
-        # 3. Ajouter et afficher la réponse de l'IA
-        if ai_response:
-            # Utiliser "assistant" pour l'affichage st.chat_message
-            add_message_to_history("assistant", ai_response)
-            with chat_container:
-                 with st.chat_message("assistant"):
-                     st.markdown(ai_response)
-        else:
-            # Afficher un message d'erreur si la réponse a échoué
-            error_message = "Désolé, une erreur s'est produite lors de la génération de la réponse. Vérifiez la configuration de l'API ou réessayez."
-            add_message_to_history("assistant", error_message) # Ajouter l'erreur à l'historique aussi
-            with chat_container:
-                 with st.chat_message("assistant"):
+        # 2. Obtenir et afficher la réponse de l'IA au fur et à mesure (streaming)
+        # Utiliser "assistant" pour l'affichage st.chat_message
+        with chat_container:
+             with st.chat_message("assistant"):
+                 ai_response = st.write_stream(stream_chat_response(user_input))
+                 if not ai_response:
+                     # Afficher un message d'erreur si la réponse a échoué
+                     error_message = "Désolé, une erreur s'est produite lors de la génération de la réponse. Vérifiez la configuration de l'API ou réessayez."
                      st.error(error_message, icon="😕")
 
+        # 3. Ajouter la réponse de l'IA (ou l'erreur) à l'historique
+        add_message_to_history("assistant", ai_response.strip() if ai_response else error_message)
+
         # Forcer un rerun peut parfois aider à rafraîchir l'UI immédiatement
         # st.rerun()
 
     # Bouton pour effacer l'historique
     if st.button("Effacer l'historique du Chat", key="clear_chat_button"):
         clear_chat_history()
-        st.rerun() # Forcer le rafraîchissement de l'interface
+        st.rerun(scope="fragment") # Rafraîchir uniquement l'interface du chat
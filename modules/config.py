@@ -1,7 +1,10 @@
 import os
+import logging
 import streamlit as st
 from dotenv import load_dotenv 
 
+logger = logging.getLogger(__name__)
+
 load_dotenv() 
 GEMINI_API_KEY = st.secrets.get("gemini_api_key", os.getenv("GOOGLE_API_KEY"))
 
@@ -37,6 +40,15 @@ QUIZ_DIFFICULTY = {
 DATABASE_NAME = "ai_prototyper_data.db"
 
 MAX_FILE_SIZE_MB = 100 
+
+# --- Cache disque des réponses Gemini (diskcache) ---
+GEMINI_DISK_CACHE_DIR = ".gemini_cache"
+GEMINI_DISK_CACHE_SIZE_LIMIT = 2**30 # 1 Go
+GEMINI_MEMORY_CACHE_MAX_ENTRIES = 128 # Repli en mémoire (LRU) si diskcache n'est pas installé
+
+# --- Cache disque du texte extrait des documents (diskcache) ---
+TEXT_DISK_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "realtimeapp")
+TEXT_DISK_CACHE_SIZE_LIMIT = 2**30 # 1 Go
 AVAILABLE_MODELS = [DEFAULT_TEXT_MODEL_NAME, "gemini-1.0-pro", "gemini-1.5-pro-latest"]
 
-print(f"Configuration chargée. Modèle texte par défaut : {DEFAULT_TEXT_MODEL_NAME}")
+logger.info("Configuration chargée. Modèle texte par défaut : %s", DEFAULT_TEXT_MODEL_NAME)
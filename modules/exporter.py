@@ -1,21 +1,29 @@
 import streamlit as st
 import pandas as pd
-from fpdf import FPDF
+from fpdf import FPDF, XPos, YPos
+from fpdf.errors import FPDFException
 import io
+import os
+import gzip
+import csv
+import functools
+import codecs
 import datetime
 import sqlite3
+import concurrent.futures
 from . import config # Pour le nom de la DB
 from . import quiz
 
 # --- Fonctions d'Export ---
 
-def export_to_csv(data, filename_prefix: str = "export") -> bytes | None:
+def export_to_csv(data, filename_prefix: str = "export", compression: str | None = None) -> bytes | None:
     """
     Exporte des données (typiquement une liste de dictionnaires ou un DataFrame) en CSV.
 
     Args:
         data: Les données à exporter (list[dict] ou pd.DataFrame).
         filename_prefix (str): Préfixe pour le nom du fichier CSV.
+        compression (str | None): Compression appliquée pendant l'écriture (ex: 'gzip'), aucune par défaut.
 
     Returns:
         bytes: Le contenu du fichier CSV en bytes, ou None si erreur.
@@ -33,39 +41,211 @@ def export_to_csv(data, filename_prefix: str = "export") -> bytes | None:
             st.error("Format de données non supporté pour l'export CSV.", icon="❌")
             return None
 
-        # Convertir le DataFrame en CSV dans un buffer mémoire
-        csv_buffer = io.StringIO()
-        df.to_csv(csv_buffer, index=False, encoding='utf-8-sig') # utf-8-sig pour compatibilité Excel
-        csv_buffer.seek(0)
+        # Écrire le CSV directement en bytes (pas de str intermédiaire à ré-encoder)
+        csv_buffer = io.BytesIO()
+        csv_kwargs = {'compression': {'method': 'gzip', 'compresslevel': 1}} if compression == 'gzip' else {'compression': compression}
+        df.to_csv(csv_buffer, index=False, encoding='utf-8-sig', lineterminator='\n', **csv_kwargs) # utf-8-sig pour compatibilité Excel
+        return csv_buffer.getvalue()
 
-        # Retourner les bytes du CSV
-        return csv_buffer.getvalue().encode('utf-8-sig')
+    except Exception as e:
+        st.error(f"Erreur lors de la génération du fichier CSV : {e}", icon="🔥")
+        return None
+
+
+# Au-delà de cette taille, le CSV est proposé compressé (.csv.gz) : le texte se compresse
+# très bien, contrairement au PDF dont fpdf2 compresse déjà le contenu.
+CSV_GZIP_THRESHOLD_BYTES = 1_000_000
+
+
+def _csv_download_payload(csv_bytes: bytes) -> tuple[bytes, str, str]:
+    """
+    Prépare le CSV pour le téléchargement, compressé en gzip (mode rapide) s'il est volumineux.
+
+    Args:
+        csv_bytes (bytes): Le contenu CSV brut.
+
+    Returns:
+        tuple: (données, extension du fichier, type MIME).
+    """
+    if len(csv_bytes) < CSV_GZIP_THRESHOLD_BYTES:
+        return csv_bytes, "csv", "text/csv"
+    return gzip.compress(csv_bytes, compresslevel=1), "csv.gz", "application/gzip"
+
+
+# En-tête du CSV des résultats de quiz (une ligne par question)
+QUIZ_CSV_HEADER = (
+    "Question_Num", "Question", "Type", "Options", "Reponse_Correcte",
+    "Reponse_Utilisateur", "Est_Correct", "Feedback", "Explication",
+)
+
+
+def export_quiz_csv(questions: list, answers: list, feedback: list) -> bytes | None:
+    """
+    Exporte les résultats d'un quiz en CSV, ligne par ligne, sans passer par un DataFrame.
+
+    Args:
+        questions (list): Liste des questions du quiz.
+        answers (list): Réponses de l'utilisateur, alignées sur les questions (None si non répondue).
+        feedback (list): Feedback (is_correct, feedback_text) par question (None si absent).
+
+    Returns:
+        bytes: Le contenu du fichier CSV en bytes (utf-8-sig), ou None si erreur.
+    """
+    if not questions:
+        st.warning("Aucune donnée à exporter en CSV.", icon="⚠️")
+        return None
+
+    n = len(questions)
+    frozen_answers, frozen_feedback = _freeze(answers, n), _freeze(feedback, n)
+    csv_bytes = _quiz_csv_cached(questions, frozen_answers, frozen_feedback)
+    if csv_bytes is None:
+        _quiz_csv_cached.clear(questions, frozen_answers, frozen_feedback) # Retirer uniquement cet échec du cache
+    return csv_bytes
+
+
+def _freeze(values: list, n: int) -> tuple:
+    """Convertit une liste indexée par question en tuple de longueur n (complété par None), hachable par st.cache_data."""
+    return tuple(values[:n]) + (None,) * (n - len(values))
+
+
+@st.cache_data(show_spinner=False, max_entries=16)
+def _quiz_csv_cached(questions: list, answers: tuple, feedback: tuple) -> bytes | None:
+    """Génération du CSV du quiz mise en cache sur ses entrées (voir `export_quiz_csv`)."""
+    try:
+        csv_buffer = io.BytesIO()
+        text_buffer = io.TextIOWrapper(csv_buffer, encoding='utf-8-sig', newline='')
+        writer = csv.writer(text_buffer, lineterminator='\n')
+        writer.writerow(QUIZ_CSV_HEADER)
+        # Réponses et feedback déjà alignés sur les questions : valeurs par défaut, puis lignes en tuples
+        user_answers = ['N/A' if ans is None else ans for ans in answers]
+        feedbacks = [(None, 'N/A') if fb is None else fb for fb in feedback]
+        get_question_type = quiz.get_question_type
+        writer.writerows([
+            (
+                i + 1,
+                q.get('question', 'N/A'),
+                get_question_type(q),
+                ", ".join(q.get('options', [])) if 'options' in q else 'N/A',
+                q.get('correct_answer', 'N/A'),
+                user_ans,
+                fb_data[0],
+                fb_data[1],
+                q.get('explanation', 'N/A'),
+            )
+            for i, (q, user_ans, fb_data) in enumerate(zip(questions, user_answers, feedbacks))
+        ])
+        text_buffer.flush()
+        return csv_buffer.getvalue()
 
     except Exception as e:
         st.error(f"Erreur lors de la génération du fichier CSV : {e}", icon="🔥")
         return None
 
 
+# Encodeur latin-1 résolu une seule fois (les polices standard de FPDF sont limitées au latin-1)
+_LATIN1_ENCODE = codecs.getencoder('latin-1')
+
+
+def _sanitize(text: str) -> str:
+    """Remplace par '?' les caractères non représentables en latin-1."""
+    if text.isascii(): # Cas le plus fréquent : rien à remplacer, aucune copie
+        return text
+    return _LATIN1_ENCODE(text, 'replace')[0].decode('latin-1')
+
+
+# Polices standard essayées dans l'ordre (Helvetica est l'équivalent "core font" d'Arial)
+PDF_FONT_CANDIDATES = ('Helvetica', 'Times')
+
+# Police TrueType Unicode (accents, guillemets typographiques, €...) : DejaVu Sans, cherchée dans
+# modules/fonts/ puis parmi les polices livrées avec matplotlib (déjà une dépendance du projet).
+# Si elle est introuvable, on revient aux polices standard avec remplacement latin-1.
+PDF_UNICODE_FONT_FAMILY = 'DejaVu'
+PDF_UNICODE_FONT_FILES = {'': 'DejaVuSans.ttf', 'B': 'DejaVuSans-Bold.ttf', 'I': 'DejaVuSans-Oblique.ttf'}
+_FONT_DIR = os.path.join(os.path.dirname(__file__), 'fonts')
+
+
+@functools.cache
+def _unicode_font_paths() -> dict | None:
+    """Chemins des fichiers TTF par style, résolus une seule fois (None si introuvables)."""
+    search_dirs = [_FONT_DIR]
+    try:
+        import matplotlib
+        search_dirs.append(os.path.join(matplotlib.get_data_path(), 'fonts', 'ttf'))
+    except ImportError:
+        pass
+    for directory in search_dirs:
+        paths = {style: os.path.join(directory, name) for style, name in PDF_UNICODE_FONT_FILES.items()}
+        if all(os.path.isfile(path) for path in paths.values()):
+            return paths
+    return None
+
+
 class PDF(FPDF):
     """Classe héritée de FPDF pour ajouter en-tête et pied de page."""
+    # Famille de police résolue une seule fois pour tout le processus (partagée par les instances)
+    _font_family: str | None = None
+    # Dernière police appliquée via _set_font_cached (None dès qu'un set_font direct a eu lieu)
+    _cur_font: tuple | None = None
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        if PDF._font_family is None:
+            PDF._font_family = self._probe_font_family()
+        elif PDF._font_family == PDF_UNICODE_FONT_FAMILY:
+            self._add_unicode_fonts() # Les polices TTF doivent être déclarées dans chaque document
+
+    def _add_unicode_fonts(self):
+        for style, path in _unicode_font_paths().items():
+            self.add_font(PDF_UNICODE_FONT_FAMILY, style, path)
+
+    def _probe_font_family(self) -> str:
+        """Retourne la police Unicode si elle est utilisable, sinon la première police standard disponible."""
+        if _unicode_font_paths():
+            try:
+                self._add_unicode_fonts()
+                return PDF_UNICODE_FONT_FAMILY
+            except Exception: # Fichier TTF illisible ou corrompu : repli sur les polices standard
+                pass
+        for family in PDF_FONT_CANDIDATES:
+            try:
+                self.set_font(family, '', 10)
+                return family
+            except (RuntimeError, FPDFException):
+                continue
+        return PDF_FONT_CANDIDATES[-1]
+
+    def set_font(self, *args, **kwargs):
+        self._cur_font = None # En-tête, pied de page ou restauration après saut de page : état inconnu
+        super().set_font(*args, **kwargs)
+
+    def _set_font_cached(self, family: str, style: str = '', size: float = 0):
+        """set_font ignoré si cette police est déjà active (évite la normalisation et la recherche de fpdf)."""
+        font = (family, style, size)
+        if font == self._cur_font:
+            return
+        self.set_font(family, style, size)
+        self._cur_font = font
+
+    def sanitize_text(self, text: str) -> str:
+        """Prépare le texte pour la police courante : inchangé en Unicode, restreint au latin-1 sinon."""
+        if self._font_family == PDF_UNICODE_FONT_FAMILY:
+            return text
+        return _sanitize(text)
+
+    def multi_cell(self, *args, new_x=XPos.LMARGIN, new_y=YPos.NEXT, **kwargs):
+        """multi_cell revenant à la marge gauche après le bloc (comportement de l'ancien PyFPDF)."""
+        return super().multi_cell(*args, new_x=new_x, new_y=new_y, **kwargs)
+
     def header(self):
-        # Utiliser une police supportant l'UTF-8 si possible ou gérer l'encodage
-        try:
-            self.set_font('Arial', 'B', 12)
-        except RuntimeError:
-            self.set_font('Times', 'B', 12)
+        # Police Unicode si disponible, sinon texte restreint au latin-1 (voir sanitize_text)
+        self.set_font(self._font_family, 'B', 12)
         title = config.APP_TITLE + ' - Export'
-        # Encoder en latin-1 pour FPDF par défaut
-        title_encoded = title.encode('latin-1', 'replace').decode('latin-1')
-        self.cell(0, 10, title_encoded, 0, 1, 'C')
+        self.cell(0, 10, self.sanitize_text(title), 0, 1, 'C')
         self.ln(10)
 
     def footer(self):
         self.set_y(-15)
-        try:
-            self.set_font('Arial', 'I', 8)
-        except RuntimeError:
-            self.set_font('Times', 'I', 8)
+        self.set_font(self._font_family, 'I', 8)
 
         page_num_text = f'Page {self.page_no()}/{{nb}}'
         self.cell(0, 10, page_num_text, 0, 0, 'C')
@@ -89,39 +269,39 @@ def export_summary_to_pdf(summary_text: str, document_name: str | None = None) -
         st.warning("Aucun résumé à exporter en PDF.", icon="⚠️")
         return None
 
+    pdf_output = _summary_pdf_cached(summary_text, document_name)
+    if pdf_output is None:
+        _summary_pdf_cached.clear(summary_text, document_name) # Retirer uniquement cet échec du cache
+    return pdf_output
+
+
+@st.cache_data(show_spinner=False, max_entries=16)
+def _summary_pdf_cached(summary_text: str, document_name: str | None) -> bytes | None:
+    """Génération du PDF du résumé mise en cache sur ses entrées (voir `export_summary_to_pdf`)."""
     try:
         pdf = PDF()
         pdf.add_page()
         pdf.set_auto_page_break(auto=True, margin=15)
 
-        # Essayer d'utiliser une police standard
-        try:
-            pdf.set_font('Arial', 'B', 14)
-        except RuntimeError:
-            pdf.set_font('Times', 'B', 14)
+        # Police résolue une seule fois (Unicode si disponible, voir PDF._font_family)
+        pdf.set_font(pdf._font_family, 'B', 14)
 
 
         title = "Résumé Généré"
         if document_name:
             title += f" pour : {document_name}"
-        # Encoder pour FPDF
-        title_encoded = title.encode('latin-1', 'replace').decode('latin-1')
-        pdf.cell(0, 10, title_encoded, 0, 1, 'L')
+        pdf.cell(0, 10, pdf.sanitize_text(title), 0, 1, 'L')
         pdf.ln(5)
 
         # Ajouter le texte du résumé
-        try:
-            pdf.set_font('Arial', '', 11)
-        except RuntimeError:
-            pdf.set_font('Times', '', 11)
-
-        # Encoder le texte principal
-        summary_text_latin1 = summary_text.encode('latin-1', 'replace').decode('latin-1')
-        pdf.multi_cell(0, 5, summary_text_latin1)
+        pdf.set_font(pdf._font_family, '', 11)
+
+        # Texte principal (restreint au latin-1 si police standard)
+        pdf.multi_cell(0, 5, pdf.sanitize_text(summary_text))
         pdf.ln(10)
 
-        # Générer le PDF en bytes
-        pdf_output = pdf.output(dest='S').encode('latin-1') # 'S' pour string/bytes
+        # Générer le PDF en bytes (fpdf2 retourne un bytearray)
+        pdf_output = bytes(pdf.output())
         return pdf_output
 
     except Exception as e:
@@ -129,14 +309,14 @@ def export_summary_to_pdf(summary_text: str, document_name: str | None = None) -
         return None
 
 
-def export_quiz_results_to_pdf(questions: list, answers: dict, feedback: dict, score: int, total_evaluated: int, document_name: str | None = None) -> bytes | None:
+def export_quiz_results_to_pdf(questions: list, answers: list, feedback: list, score: int, total_evaluated: int, document_name: str | None = None) -> bytes | None:
     """
     Exporte les résultats d'un quiz (questions, réponses, feedback, score) en PDF.
 
     Args:
         questions (list): Liste des questions du quiz.
-        answers (dict): Dictionnaire des réponses de l'utilisateur {index: reponse}.
-        feedback (dict): Dictionnaire du feedback {index: (is_correct, feedback_text)}.
+        answers (list): Réponses de l'utilisateur, alignées sur les questions (None si non répondue).
+        feedback (list): Feedback (is_correct, feedback_text) par question (None si absent).
         score (int): Score obtenu (QCM/VF).
         total_evaluated (int): Nombre total de questions QCM/VF.
         document_name (str | None): Nom du document source (optionnel).
@@ -148,96 +328,91 @@ def export_quiz_results_to_pdf(questions: list, answers: dict, feedback: dict, s
         st.warning("Aucun résultat de quiz à exporter en PDF.", icon="⚠️")
         return None
 
+    n = len(questions)
+    frozen_answers, frozen_feedback = _freeze(answers, n), _freeze(feedback, n)
+    pdf_output = _quiz_results_pdf_cached(questions, frozen_answers, frozen_feedback, score, total_evaluated, document_name)
+    if pdf_output is None:
+        _quiz_results_pdf_cached.clear(questions, frozen_answers, frozen_feedback, score, total_evaluated, document_name) # Retirer uniquement cet échec du cache
+    return pdf_output
+
+
+@st.cache_data(show_spinner=False, max_entries=16)
+def _quiz_results_pdf_cached(questions: list, answers: tuple, feedback: tuple, score: int, total_evaluated: int, document_name: str | None) -> bytes | None:
+    """Génération du PDF des résultats mise en cache sur ses entrées (voir `export_quiz_results_to_pdf`)."""
     try:
         pdf = PDF()
         pdf.add_page()
         pdf.set_auto_page_break(auto=True, margin=15)
+        # Méthodes et fonctions liées une fois pour la boucle par question
+        sanitize = pdf.sanitize_text
+        multi_cell = pdf.multi_cell
+        ln = pdf.ln
+        set_font = pdf._set_font_cached
+        # Styles fixes de chaque bloc d'une question, calculés une seule fois
+        question_font = (pdf._font_family, 'B', 11)
+        detail_font = (pdf._font_family, '', 10)
+        feedback_font = (pdf._font_family, 'I', 10)
+        get_question_type = quiz.get_question_type
 
         # --- Titre ---
-        try:
-            pdf.set_font('Arial', 'B', 14)
-        except RuntimeError:
-            pdf.set_font('Times', 'B', 14)
+        pdf.set_font(pdf._font_family, 'B', 14)
         title = "Résultats du Quiz"
         if document_name:
             title += f" - Document : {document_name}"
-        title_encoded = title.encode('latin-1', 'replace').decode('latin-1')
-        pdf.cell(0, 10, title_encoded, 0, 1, 'L')
+        pdf.cell(0, 10, sanitize(title), 0, 1, 'L')
         pdf.ln(5)
 
         # --- Score ---
-        try:
-            pdf.set_font('Arial', 'B', 12)
-        except RuntimeError:
-            pdf.set_font('Times', 'B', 12)
+        pdf.set_font(pdf._font_family, 'B', 12)
         if total_evaluated > 0:
             percentage = (score / total_evaluated) * 100
             score_text = f"Score Final (QCM/Vrai-Faux) : {score}/{total_evaluated} ({percentage:.1f}%)"
         else:
             score_text = "Score : Aucune question QCM/Vrai-Faux évaluée"
-        score_text_encoded = score_text.encode('latin-1', 'replace').decode('latin-1')
-        pdf.cell(0, 10, score_text_encoded, 0, 1, 'L')
+        pdf.cell(0, 10, sanitize(score_text), 0, 1, 'L')
         pdf.ln(5)
 
         # --- Détails par question ---
-        for i, q_data in enumerate(questions):
+        for i, (q_data, user_ans, fb_data) in enumerate(zip(questions, answers, feedback)):
             # Police pour la question
-            try:
-                pdf.set_font('Arial', 'B', 11)
-            except RuntimeError:
-                pdf.set_font('Times', 'B', 11)
-            q_text = q_data.get('question', 'N/A').encode('latin-1', 'replace').decode('latin-1')
-            pdf.multi_cell(0, 5, f"Question {i+1}: {q_text}")
-            pdf.ln(2)
+            set_font(*question_font)
+            multi_cell(0, 5, sanitize(f"Question {i+1}: {q_data.get('question', 'N/A')}"))
+            ln(2)
 
             # Police pour les détails
-            try:
-                pdf.set_font('Arial', '', 10)
-            except RuntimeError:
-                pdf.set_font('Times', '', 10)
+            set_font(*detail_font)
 
-            user_ans = answers.get(i, "*Non répondue*")
-            fb_data = feedback.get(i)
-            q_type = quiz.detect_quiz_type(q_data)
+            q_type = get_question_type(q_data)
 
             # Formater la réponse utilisateur
             if isinstance(user_ans, bool): user_ans_str = "Vrai" if user_ans else "Faux"
             elif user_ans is None: user_ans_str = "*Non répondue*"
             else: user_ans_str = str(user_ans)
-            user_ans_str_encoded = user_ans_str.encode('latin-1', 'replace').decode('latin-1')
-            pdf.multi_cell(0, 5, f"Votre réponse : {user_ans_str_encoded}")
+            multi_cell(0, 5, sanitize(f"Votre réponse : {user_ans_str}"))
 
             # Afficher la correction et l'explication
-            correct_ans_str_encoded = "N/A"
             if q_type == "QCM" or q_type == "Vrai/Faux":
                 correct_ans = q_data.get('correct_answer')
                 if isinstance(correct_ans, bool): correct_ans_str = "Vrai" if correct_ans else "Faux"
                 else: correct_ans_str = str(correct_ans)
-                correct_ans_str_encoded = correct_ans_str.encode('latin-1', 'replace').decode('latin-1')
-                pdf.multi_cell(0, 5, f"Réponse correcte : {correct_ans_str_encoded}")
+                multi_cell(0, 5, sanitize(f"Réponse correcte : {correct_ans_str}"))
             elif q_type == "Ouvertes":
                  ideal_points = q_data.get('ideal_answer_points', ['N/A'])
-                 ideal_points_str = ", ".join(ideal_points).encode('latin-1', 'replace').decode('latin-1')
-                 pdf.multi_cell(0, 5, f"Points clés attendus : {ideal_points_str}")
+                 multi_cell(0, 5, sanitize(f"Points clés attendus : {', '.join(ideal_points)}"))
 
 
-            explanation = q_data.get('explanation', 'N/A').encode('latin-1', 'replace').decode('latin-1')
-            pdf.multi_cell(0, 5, f"Explication : {explanation}")
+            multi_cell(0, 5, sanitize(f"Explication : {q_data.get('explanation', 'N/A')}"))
 
             # Afficher le feedback
             if fb_data:
-                 fb_text = fb_data[1].encode('latin-1', 'replace').decode('latin-1')
                  status_icon = "[Correct]" if fb_data[0] else "[Incorrect]" if fb_data[0] is False else "[Ouverte]"
-                 try:
-                     pdf.set_font('Arial', 'I', 10)
-                 except RuntimeError:
-                     pdf.set_font('Times', 'I', 10)
-                 pdf.multi_cell(0, 5, f"Feedback : {status_icon} {fb_text}")
+                 set_font(*feedback_font)
+                 multi_cell(0, 5, sanitize(f"Feedback : {status_icon} {fb_data[1]}"))
 
-            pdf.ln(5) # Espace entre les questions
+            ln(5) # Espace entre les questions
 
-        # Générer le PDF en bytes
-        pdf_output = pdf.output(dest='S').encode('latin-1')
+        # Générer le PDF en bytes (fpdf2 retourne un bytearray)
+        pdf_output = bytes(pdf.output())
         return pdf_output
 
     except Exception as e:
@@ -246,13 +421,8 @@ def export_quiz_results_to_pdf(questions: list, answers: dict, feedback: dict, s
 
 
 # --- Fonctions Base de Données (SQLite - Optionnel) ---
-# ... (init_db, save_summary_to_db, etc. restent identiques) ...
-def init_db(db_name: str = config.DATABASE_NAME):
-    """Initialise la base de données SQLite et crée les tables si elles n'existent pas."""
-    try:
-        conn = sqlite3.connect(db_name)
-        cursor = conn.cursor()
-        cursor.execute("""
+# Schéma idempotent (CREATE TABLE IF NOT EXISTS), exécutable à chaque démarrage
+SCHEMA_SQL = """
         CREATE TABLE IF NOT EXISTS summaries (
             id INTEGER PRIMARY KEY AUTOINCREMENT,
             document_name TEXT,
@@ -260,9 +430,7 @@ def init_db(db_name: str = config.DATABASE_NAME):
             level TEXT,
             keywords TEXT,
             summary_text TEXT NOT NULL
-        )
-        """)
-        cursor.execute("""
+        );
         CREATE TABLE IF NOT EXISTS quiz_results (
             id INTEGER PRIMARY KEY AUTOINCREMENT,
             document_name TEXT,
@@ -273,33 +441,119 @@ def init_db(db_name: str = config.DATABASE_NAME):
             score INTEGER,
             total_evaluated INTEGER,
             results_details TEXT -- Stocker les questions/réponses/feedback en JSON ?
-        )
-        """)
-        conn.commit()
-        conn.close()
+        );
+"""
+
+_INSERT_SUMMARY_SQL = "INSERT INTO summaries (document_name, level, keywords, summary_text) VALUES (?, ?, ?, ?)"
+
+
+@st.cache_resource(show_spinner=False)
+def get_db_connection(db_name: str = config.DATABASE_NAME) -> sqlite3.Connection:
+    """
+    Ouvre une seule connexion SQLite par base, partagée entre les reruns et les sessions.
+
+    La connexion est en autocommit (isolation_level=None) et en mode WAL : chaque écriture
+    est validée sans commit explicite et n'est pas bloquée par les lectures concurrentes.
+
+    Args:
+        db_name (str): Chemin du fichier de base de données.
+
+    Returns:
+        sqlite3.Connection: La connexion réutilisable.
+    """
+    conn = sqlite3.connect(db_name, check_same_thread=False, isolation_level=None)
+    conn.executescript("PRAGMA journal_mode=WAL; PRAGMA synchronous=NORMAL;")
+    return conn
+
+def init_db(db_name: str = config.DATABASE_NAME):
+    """Initialise la base de données SQLite et crée les tables si elles n'existent pas."""
+    try:
+        get_db_connection(db_name).executescript(SCHEMA_SQL)
     except sqlite3.Error as e:
         st.error(f"Erreur lors de l'initialisation de la base de données SQLite : {e}", icon="🔥")
 
-def save_summary_to_db(summary_text: str, level: str, keywords: str | None, document_name: str | None, db_name: str = config.DATABASE_NAME):
-    """Sauvegarde un résumé dans la base de données SQLite."""
-    if not summary_text: return False
+# Écritures SQLite sérialisées sur un unique thread dédié : l'interface n'attend pas le fsync
+# et l'ordre des sauvegardes est conservé (le mode WAL laisse les lectures se poursuivre).
+_DB_EXECUTOR = concurrent.futures.ThreadPoolExecutor(max_workers=1, thread_name_prefix="sqlite-writer")
+PENDING_DB_WRITES_KEY = "pending_db_writes" # Sauvegardes en cours : [(future, message de succès)]
+
+def _insert_summaries(conn: sqlite3.Connection, rows: list):
+    """Insère les résumés (exécuté sur le thread d'écriture)."""
+    # Transaction explicite : un seul fsync pour tout le lot malgré l'autocommit
+    with conn:
+        conn.execute("BEGIN")
+        conn.executemany(_INSERT_SUMMARY_SQL, rows)
+
+def _submit_summaries(rows: list, success_message: str, db_name: str) -> concurrent.futures.Future | None:
+    """Planifie l'insertion en arrière-plan ; le résultat est signalé par `report_pending_db_writes`."""
     try:
-        conn = sqlite3.connect(db_name)
-        cursor = conn.cursor()
-        cursor.execute("""
-        INSERT INTO summaries (document_name, level, keywords, summary_text)
-        VALUES (?, ?, ?, ?)
-        """, (document_name, level, keywords, summary_text))
-        conn.commit()
-        conn.close()
-        st.success("Résumé sauvegardé dans la base de données.", icon="💾")
-        return True
+        conn = get_db_connection(db_name)
     except sqlite3.Error as e:
-        st.error(f"Erreur lors de la sauvegarde du résumé en base de données : {e}", icon="🔥")
-        return False
+        st.error(f"Erreur lors de l'ouverture de la base de données : {e}", icon="🔥")
+        return None
+    future = _DB_EXECUTOR.submit(_insert_summaries, conn, rows)
+    st.session_state.setdefault(PENDING_DB_WRITES_KEY, []).append((future, success_message))
+    return future
+
+def save_summary_to_db(summary_text: str, level: str, keywords: str | None, document_name: str | None, db_name: str = config.DATABASE_NAME) -> concurrent.futures.Future | None:
+    """
+    Sauvegarde un résumé dans la base de données SQLite, sans bloquer l'interface.
+
+    Returns:
+        Future | None: L'écriture planifiée (résultat signalé par un toast au rerun suivant), ou None.
+    """
+    if not summary_text: return None
+    return _submit_summaries([(document_name, level, keywords, summary_text)], "Résumé sauvegardé dans la base de données.", db_name)
+
+def save_summaries_bulk(rows, db_name: str = config.DATABASE_NAME) -> concurrent.futures.Future | None:
+    """
+    Sauvegarde plusieurs résumés en une seule instruction préparée (executemany), en arrière-plan.
+
+    Args:
+        rows: Itérable de tuples (document_name, level, keywords, summary_text).
+        db_name (str): Chemin du fichier de base de données.
+
+    Returns:
+        Future | None: L'écriture planifiée, ou None si la base n'a pas pu être ouverte.
+    """
+    rows = list(rows)
+    return _submit_summaries(rows, f"{len(rows)} résumé(s) sauvegardé(s) dans la base de données.", db_name)
+
+def report_pending_db_writes():
+    """Signale (toast ou erreur) les sauvegardes terminées depuis le dernier rerun."""
+    pending = st.session_state.get(PENDING_DB_WRITES_KEY)
+    if not pending:
+        return
+    still_running = []
+    for future, success_message in pending:
+        if not future.done():
+            still_running.append((future, success_message))
+            continue
+        error = future.exception()
+        if error is None:
+            st.toast(success_message, icon="💾")
+        else:
+            st.error(f"Erreur lors de la sauvegarde du résumé en base de données : {error}", icon="🔥")
+    st.session_state[PENDING_DB_WRITES_KEY] = still_running
 
 # --- Interface Streamlit pour l'Export ---
 
+def _get_prepared_export(state_key: str, source):
+    """
+    Retourne le fichier déjà généré pour ces données, s'il est encore valable.
+
+    Args:
+        state_key (str): Clé de session où est conservé le couple (source, contenu).
+        source: L'objet exporté (résumé ou liste de questions), comparé par identité.
+
+    Returns:
+        Le contenu généré (bytes, ou tuple pour le CSV), ou None s'il faut (re)générer le fichier.
+    """
+    prepared = st.session_state.get(state_key)
+    if prepared is not None and prepared[0] is source:
+        return prepared[1]
+    return None
+
 def display_export_options(export_type: str, data_to_export, filename_base: str):
     """
     Affiche les boutons d'exportation CSV et PDF pour un type de données donné.
@@ -310,9 +564,33 @@ def display_export_options(export_type: str, data_to_export, filename_base: str)
         data_to_export: Les données spécifiques à exporter (texte, liste, etc.).
         filename_base (str): Base pour le nom de fichier (ex: nom du document).
     """
+    report_pending_db_writes() # Résultat des sauvegardes DB lancées lors d'un rerun précédent
+    # Données exportables : CSV pour les résultats structurés du quiz, PDF pour le résumé et le quiz
+    csv_source = None
+    pdf_source = None
+    if export_type == 'summary' and isinstance(data_to_export, str):
+        pdf_source = data_to_export or None
+    elif export_type == 'quiz_results':
+        # État du quiz lu une seule fois depuis la session, réutilisé par les deux exports
+        session_state = st.session_state
+        questions = session_state.get(quiz.QUIZ_QUESTIONS_KEY, [])
+        answers = session_state.get(quiz.QUIZ_ANSWERS_KEY, [])
+        feedback = session_state.get(quiz.QUIZ_FEEDBACK_KEY, [])
+        score = session_state.get(quiz.QUIZ_SCORE_KEY, 0)
+        csv_source = questions or None # Vérifier s'il y a des questions
+        pdf_source = csv_source
+
     st.markdown("---")
     st.markdown("**Exporter :**")
-    col1, col2, col3 = st.columns([1, 1, 2]) # Ajuster les largeurs au besoin
+    if pdf_source is None:
+        # Aucun bouton (même désactivé) quand il n'y a rien à exporter
+        st.caption("Aucune donnée à exporter pour le moment.")
+        return
+    # Colonnes selon les exports disponibles (pas de colonne CSV pour un résumé)
+    if csv_source is not None:
+        col1, col2, col3 = st.columns([1, 1, 2]) # Ajuster les largeurs au besoin
+    else:
+        col2, col3 = st.columns([1, 3])
 
     timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
     filename_prefix = f"{filename_base}_{export_type}_{timestamp}"
@@ -320,70 +598,44 @@ def display_export_options(export_type: str, data_to_export, filename_base: str)
     # Générer des clés uniques basées sur le type d'export
     csv_button_key = f"export_csv_{export_type}_button"
     pdf_button_key = f"export_pdf_{export_type}_button"
+    csv_prepare_key = f"export_csv_{export_type}_prepare"
+    pdf_prepare_key = f"export_pdf_{export_type}_prepare"
+    csv_state_key = f"export_csv_{export_type}_bytes" # Fichiers générés, conservés en session
+    pdf_state_key = f"export_pdf_{export_type}_bytes"
     db_button_key = f"export_db_{export_type}_button" # Pour le bouton DB optionnel
 
-    with col1:
-        # Export CSV
-        csv_bytes = None
-        csv_enabled = False
-        if export_type == 'quiz_results': # CSV pertinent pour les résultats structurés
-            questions = st.session_state.get(quiz.QUIZ_QUESTIONS_KEY, [])
-            if questions: # Vérifier s'il y a des questions avant de préparer les données
-                answers = st.session_state.get(quiz.QUIZ_ANSWERS_KEY, {})
-                feedback = st.session_state.get(quiz.QUIZ_FEEDBACK_KEY, {})
-                csv_data = []
-                for i, q in enumerate(questions):
-                    fb_data = feedback.get(i, (None, 'N/A'))
-                    csv_data.append({
-                        "Question_Num": i + 1,
-                        "Question": q.get('question', 'N/A'),
-                        "Type": quiz.detect_quiz_type(q),
-                        "Options": ", ".join(q.get('options', [])) if 'options' in q else 'N/A',
-                        "Reponse_Correcte": q.get('correct_answer', 'N/A'),
-                        "Reponse_Utilisateur": answers.get(i, 'N/A'),
-                        "Est_Correct": fb_data[0],
-                        "Feedback": fb_data[1],
-                        "Explication": q.get('explanation', 'N/A')
-                    })
-                csv_bytes = export_to_csv(csv_data, filename_prefix)
+    if csv_source is not None:
+        with col1:
+            # Export CSV : généré uniquement sur demande (bouton), pas à chaque rerun
+            csv_payload = _get_prepared_export(csv_state_key, csv_source)
+            if csv_payload is None and st.button("⚙️ Générer CSV", key=csv_prepare_key, help="Préparer le fichier CSV des résultats."):
+                csv_bytes = export_quiz_csv(csv_source, answers, feedback)
                 if csv_bytes:
-                    csv_enabled = True
-
-        if csv_enabled:
-            st.download_button(
-                label="📥 CSV",
-                data=csv_bytes,
-                file_name=f"{filename_prefix}.csv",
-                mime='text/csv',
-                key=csv_button_key, # Clé unique
-                help="Exporter les résultats détaillés en CSV."
-            )
-        else:
-            # Afficher un bouton désactivé même si non pertinent pour ce type
-            st.button(
-                "📥 CSV",
-                key=csv_button_key, # Clé unique
-                disabled=True,
-                help="Export CSV non disponible ou données manquantes."
-            )
+                    csv_payload = _csv_download_payload(csv_bytes) # Compressé une seule fois, à la génération
+                    st.session_state[csv_state_key] = (csv_source, csv_payload)
+            if csv_payload:
+                csv_data, csv_extension, csv_mime = csv_payload
+                st.download_button(
+                    label="📥 CSV",
+                    data=csv_data,
+                    file_name=f"{filename_prefix}.{csv_extension}",
+                    mime=csv_mime,
+                    key=csv_button_key, # Clé unique
+                    help="Exporter les résultats détaillés en CSV."
+                )
 
     with col2:
-        # Export PDF
-        pdf_bytes = None
-        pdf_enabled = False
-        if export_type == 'summary' and isinstance(data_to_export, str):
-            pdf_bytes = export_summary_to_pdf(data_to_export, filename_base)
-        elif export_type == 'quiz_results':
-             questions = st.session_state.get(quiz.QUIZ_QUESTIONS_KEY, [])
-             if questions: # Vérifier s'il y a des questions
-                 answers = st.session_state.get(quiz.QUIZ_ANSWERS_KEY, {})
-                 feedback = st.session_state.get(quiz.QUIZ_FEEDBACK_KEY, {})
-                 score = st.session_state.get(quiz.QUIZ_SCORE_KEY, 0)
-                 evaluated = sum(1 for fb in feedback.values() if fb[0] is not None)
-                 pdf_bytes = export_quiz_results_to_pdf(questions, answers, feedback, score, evaluated, filename_base)
-
+        # Export PDF : généré uniquement sur demande (bouton), pas à chaque rerun
+        pdf_bytes = _get_prepared_export(pdf_state_key, pdf_source)
+        if pdf_bytes is None and st.button("⚙️ Générer PDF", key=pdf_prepare_key, help=f"Préparer le PDF : {export_type.replace('_', ' ')}."):
+            if export_type == 'summary':
+                pdf_bytes = export_summary_to_pdf(pdf_source, filename_base)
+            else:
+                evaluated = sum(1 for fb in feedback if fb is not None and fb[0] is not None)
+                pdf_bytes = export_quiz_results_to_pdf(pdf_source, answers, feedback, score, evaluated, filename_base)
+            if pdf_bytes:
+                st.session_state[pdf_state_key] = (pdf_source, pdf_bytes)
         if pdf_bytes:
-            pdf_enabled = True
             st.download_button(
                 label="📄 PDF",
                 data=pdf_bytes,
@@ -392,13 +644,6 @@ def display_export_options(export_type: str, data_to_export, filename_base: str)
                 key=pdf_button_key, # Clé unique
                 help=f"Exporter {export_type.replace('_', ' ')} en PDF."
             )
-        else:
-            st.button(
-                "📄 PDF",
-                key=pdf_button_key, # Clé unique
-                disabled=True,
-                help="Impossible de générer le PDF ou données manquantes."
-            )
 
     # with col3: # Optionnel : Sauvegarde DB
     #     db_enabled = False
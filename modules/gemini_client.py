@@ -2,35 +2,63 @@ import google.generativeai as genai
 import streamlit as st
 from PIL import Image # Pour le traitement d'images si multimodal
 import io
+import threading
+from collections import OrderedDict
+from collections.abc import Iterator
 from . import config
+from . import utils
+
+# Cache disque optionnel des réponses (partagé entre sessions, processus et redémarrages)
+try:
+    from diskcache import Cache
+except ImportError:
+    Cache = None
+
+# Clé de st.session_state du bouton "ignorer le cache" (sidebar) pour forcer une régénération
+BYPASS_CACHE_KEY = "gemini_bypass_cache"
+# Clé de st.session_state : client Gemini configuré avec succès dans cette session
+GEMINI_CONFIGURED_KEY = "gemini_configured"
 
-_gemini_client_initialized = False
-_generative_model = None
 _vision_model = None
 
+@st.cache_resource(show_spinner=False)
+def _configure_client(api_key: str) -> bool:
+    """Appelle genai.configure une seule fois par processus et par clé (une exception n'est pas mise en cache)."""
+    genai.configure(api_key=api_key)
+    return True
+
 def configure_gemini():
     """
     Configure l'API Google Gemini avec la clé API.
-    Doit être appelée une fois au début.
+    Peut être appelée à chaque rerun : genai.configure ne s'exécute qu'une fois par processus.
     """
-    global _gemini_client_initialized
-    if not _gemini_client_initialized:
-        try:
-            if not config.GEMINI_API_KEY or config.GEMINI_API_KEY == "NO_KEY_CONFIGURED":
-                 # L'erreur est déjà gérée dans config.py ou app.py, on ne bloque pas ici
-                 # mais les fonctions suivantes échoueront probablement.
-                 st.warning("Clé API Gemini non disponible. Les fonctionnalités IA sont désactivées.", icon="⚠️")
-                 return False # Indique que la configuration a échoué
-
-            genai.configure(api_key=config.GEMINI_API_KEY)
-            _gemini_client_initialized = True
-            st.success("Client Gemini configuré avec succès.", icon="✅")
-            return True
-        except Exception as e:
-            st.error(f"Erreur lors de la configuration de l'API Gemini : {e}", icon="🔥")
-            _gemini_client_initialized = False
-            return False
-    return True # Déjà initialisé
+    # Déjà configuré avec succès pour cette session : la clé ne change pas en cours d'exécution,
+    # inutile de revérifier la clé et de hacher les arguments du cache de _configure_client.
+    # Un échec n'est pas mémorisé (nouvelle tentative et message à l'appel suivant).
+    if st.session_state.get(GEMINI_CONFIGURED_KEY, False):
+        return True
+
+    try:
+        if not config.GEMINI_API_KEY or config.GEMINI_API_KEY == "NO_KEY_CONFIGURED":
+             # L'erreur est déjà gérée dans config.py ou app.py, on ne bloque pas ici
+             # mais les fonctions suivantes échoueront probablement.
+             st.warning("Clé API Gemini non disponible. Les fonctionnalités IA sont désactivées.", icon="⚠️")
+             return False # Indique que la configuration a échoué
+
+        _configure_client(config.GEMINI_API_KEY)
+    except Exception as e:
+        st.error(f"Erreur lors de la configuration de l'API Gemini : {e}", icon="🔥")
+        return False
+
+    st.session_state[GEMINI_CONFIGURED_KEY] = True
+    # Notification éphémère, une seule fois par session : les appels suivants s'arrêtent au test ci-dessus
+    st.toast("Client Gemini prêt.", icon="✅")
+    return True
+
+@st.cache_resource(show_spinner=False)
+def _make_model(api_key: str, model_name: str) -> genai.GenerativeModel:
+    """Construit le modèle une seule fois par (clé API, nom de modèle), partagé entre reruns et sessions."""
+    return genai.GenerativeModel(model_name)
 
 def get_generative_model(model_name: str = config.DEFAULT_TEXT_MODEL_NAME):
     """
@@ -43,42 +71,110 @@ def get_generative_model(model_name: str = config.DEFAULT_TEXT_MODEL_NAME):
     Returns:
         genai.GenerativeModel: Une instance du modèle, ou None si erreur/non configuré.
     """
-    global _generative_model
-    if not _gemini_client_initialized:
-        if not configure_gemini():
-            return None # La configuration a échoué
+    if not configure_gemini():
+        return None # La configuration a échoué
 
-    # Initialiser le modèle spécifique si pas déjà fait ou si le nom change
-    # Note: Pourrait être simplifié si on utilise toujours le même modèle texte
+    # Une instance par modèle, mise en cache : changer de modèle ne reconstruit plus l'autre
     try:
-        # Pour l'instant, on réutilise la même instance si le nom est le même
-        # Si on voulait changer de modèle dynamiquement, il faudrait gérer ça
-        if _generative_model is None or _generative_model.model_name != f"models/{model_name}":
-             _generative_model = genai.GenerativeModel(model_name)
-        return _generative_model
+        return _make_model(config.GEMINI_API_KEY, model_name)
     except Exception as e:
         st.error(f"Erreur lors de l'initialisation du modèle Gemini '{model_name}': {e}", icon="🤖")
         return None
 
 # --- Fonctions d'interaction avec l'API ---
 
-@st.cache_data(show_spinner="Génération de la réponse par l'IA...") # Cache la réponse pour les mêmes inputs
+@st.cache_resource(show_spinner=False)
+def _get_disk_cache():
+    """Retourne le cache disque des réponses Gemini (None si diskcache n'est pas installé)."""
+    if Cache is None:
+        return None
+    try:
+        return Cache(config.GEMINI_DISK_CACHE_DIR, size_limit=config.GEMINI_DISK_CACHE_SIZE_LIMIT)
+    except Exception as e:
+        st.warning(f"Cache disque des réponses IA indisponible : {e}", icon="⚠️")
+        return None
+
+class _LRUCache:
+    """Cache LRU borné en mémoire du processus, avec la même interface get/set que diskcache.Cache."""
+
+    def __init__(self, max_entries: int):
+        self._max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock() # Partagé entre les threads des sessions Streamlit
+
+    def get(self, key, default=None):
+        with self._lock:
+            if key not in self._entries:
+                return default
+            self._entries.move_to_end(key)
+            return self._entries[key]
+
+    def set(self, key, value):
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            if len(self._entries) > self._max_entries:
+                self._entries.popitem(last=False) # Évincer l'entrée la moins récemment utilisée
+
+# Repli en mémoire si diskcache n'est pas installé (clé = empreinte du prompt, voir `_cache_key`)
+_memory_cache = _LRUCache(config.GEMINI_MEMORY_CACHE_MAX_ENTRIES)
+
+def _get_response_cache():
+    """Retourne le cache des réponses : sur disque si possible, sinon le LRU en mémoire."""
+    disk_cache = _get_disk_cache()
+    return disk_cache if disk_cache is not None else _memory_cache
+
 def generate_text(prompt: str,
                   model_name: str = config.DEFAULT_TEXT_MODEL_NAME,
                   temperature: float = 0.7,
-                  max_output_tokens: int = 1024) -> str | None:
+                  max_output_tokens: int = 1024,
+                  response_schema: dict | None = None) -> str | None:
     """
     Génère du texte en utilisant le modèle Gemini spécifié.
+    Les réponses sont mises en cache sur disque (diskcache) pour être réutilisées entre
+    sessions et redémarrages ; à défaut, dans un LRU borné en mémoire. Le cache est ignoré
+    si l'option correspondante de la sidebar est activée.
 
     Args:
         prompt (str): Le prompt à envoyer au modèle.
         model_name (str): Le nom du modèle à utiliser.
         temperature (float): Contrôle l'aléatoire de la sortie (0.0 - 1.0).
         max_output_tokens (int): Nombre maximum de tokens à générer.
+        response_schema (dict | None): Schéma (sous-ensemble OpenAPI) de la réponse attendue.
+                                       Si fourni, Gemini répond en JSON conforme à ce schéma.
 
     Returns:
         str: Le texte généré par le modèle, ou None en cas d'erreur.
     """
+    response_cache = _get_response_cache()
+    cache_key = _cache_key(prompt, model_name, temperature, max_output_tokens, response_schema)
+    if not st.session_state.get(BYPASS_CACHE_KEY, False):
+        cached = response_cache.get(cache_key)
+        if cached is not None:
+            return cached
+
+    with st.spinner("Génération de la réponse par l'IA..."):
+        result = _generate_text_uncached(prompt, model_name, temperature, max_output_tokens, response_schema)
+    if result: # Ne pas mémoriser les échecs (erreur API, réponse bloquée)
+        response_cache.set(cache_key, result)
+    return result
+
+def _cache_key(prompt: str, model_name: str, temperature: float, max_output_tokens: int,
+               response_schema: dict | None = None) -> tuple:
+    """Clé du cache des réponses : paramètres de génération + empreinte du prompt (pas le prompt complet)."""
+    return (model_name, temperature, max_output_tokens, repr(response_schema), utils.content_hash(prompt))
+
+def _parts_text(parts) -> str:
+    """Concatène le texte des parties d'une réponse Gemini (les parties sans texte sont ignorées)."""
+    texts = [getattr(part, 'text', None) for part in parts] # Un seul accès par partie (pas de hasattr + .text)
+    return "".join([text for text in texts if text is not None])
+
+def _generate_text_uncached(prompt: str,
+                            model_name: str,
+                            temperature: float,
+                            max_output_tokens: int,
+                            response_schema: dict | None = None) -> str | None:
+    """Appel direct à l'API Gemini, sans cache (voir `generate_text`)."""
     model = get_generative_model(model_name)
     if not model:
         st.error("Le modèle génératif Gemini n'est pas disponible.", icon="❌")
@@ -92,6 +188,10 @@ def generate_text(prompt: str,
             # top_p=0.9, # Autres paramètres possibles
             # top_k=40
         )
+        if response_schema is not None:
+            # Sortie structurée : JSON conforme au schéma, sans consignes de format dans le prompt
+            generation_config.response_mime_type = "application/json"
+            generation_config.response_schema = response_schema
 
         # Appel à l'API Gemini
         response = model.generate_content(
@@ -104,7 +204,7 @@ def generate_text(prompt: str,
         if response and response.candidates and response.candidates[0].content.parts:
              # Accéder correctement au texte généré
              # La structure peut varier légèrement selon la version de l'API et le type de réponse
-            generated_text = "".join(part.text for part in response.candidates[0].content.parts if hasattr(part, 'text'))
+            generated_text = _parts_text(response.candidates[0].content.parts)
             if generated_text:
                 return generated_text.strip()
             else:
@@ -125,6 +225,87 @@ def generate_text(prompt: str,
         # if hasattr(e, 'response'): st.error(f"Détails de l'erreur API: {e.response.text}")
         return None
 
+def generate_text_stream(prompt: str,
+                         model_name: str = config.DEFAULT_TEXT_MODEL_NAME,
+                         temperature: float = 0.7,
+                         max_output_tokens: int = 1024) -> Iterator[str]:
+    """
+    Génère du texte en streaming : les morceaux de réponse sont produits au fur et à mesure
+    de leur réception (à utiliser avec st.write_stream). Partage le cache des réponses de `generate_text`.
+
+    Args:
+        prompt (str): Le prompt à envoyer au modèle.
+        model_name (str): Le nom du modèle à utiliser.
+        temperature (float): Contrôle l'aléatoire de la sortie (0.0 - 1.0).
+        max_output_tokens (int): Nombre maximum de tokens à générer.
+
+    Yields:
+        str: Les morceaux successifs du texte généré (rien en cas d'erreur).
+    """
+    response_cache = _get_response_cache()
+    cache_key = _cache_key(prompt, model_name, temperature, max_output_tokens)
+    if not st.session_state.get(BYPASS_CACHE_KEY, False):
+        cached = response_cache.get(cache_key)
+        if cached is not None:
+            yield cached
+            return
+
+    model = get_generative_model(model_name)
+    if not model:
+        st.error("Le modèle génératif Gemini n'est pas disponible.", icon="❌")
+        return
+
+    chunks = []
+    try:
+        generation_config = genai.types.GenerationConfig(
+            temperature=temperature,
+            max_output_tokens=max_output_tokens
+        )
+        response = model.generate_content(prompt, generation_config=generation_config, stream=True)
+
+        for chunk in response:
+            parts = chunk.candidates[0].content.parts if chunk.candidates else None
+            if not parts:
+                continue # Morceau sans texte (ex: métadonnées de sécurité)
+            text = _parts_text(parts)
+            if text:
+                chunks.append(text)
+                yield text
+
+        if not chunks:
+            # Gérer le cas où la réponse est bloquée ou vide
+            block_reason = response.prompt_feedback.block_reason if response.prompt_feedback else "Inconnue"
+            st.warning(f"La réponse de Gemini était vide ou bloquée. Raison: {block_reason}.", icon="⚠️")
+            return
+
+    except Exception as e:
+        st.error(f"Erreur lors de l'appel à l'API Gemini : {e}", icon="🔥")
+        return
+
+    # Ne mémoriser que les réponses complètes
+    response_cache.set(cache_key, "".join(chunks).strip())
+
+def count_tokens(text: str, model_name: str = config.DEFAULT_TEXT_MODEL_NAME) -> int | None:
+    """
+    Compte le nombre de tokens d'un texte pour le modèle Gemini spécifié.
+
+    Args:
+        text (str): Le texte à mesurer.
+        model_name (str): Le nom du modèle dont le tokenizer est utilisé.
+
+    Returns:
+        int: Le nombre de tokens, ou None si le comptage a échoué.
+    """
+    model = get_generative_model(model_name)
+    if not model:
+        return None
+
+    try:
+        return model.count_tokens(text).total_tokens
+    except Exception as e:
+        st.warning(f"Impossible de compter les tokens via Gemini : {e}", icon="⚠️")
+        return None
+
 # --- Fonction multimodale ---
 
 # @st.cache_data(show_spinner="Analyse de l'image par l'IA...")
@@ -141,9 +322,8 @@ def generate_text(prompt: str,
 #         str: La réponse textuelle de l'analyse, ou None en cas d'erreur.
 #     """
 #     global _vision_model
-#     if not _gemini_client_initialized:
-#         if not configure_gemini():
-#             return None
+#     if not configure_gemini():
+#         return None
 
 #     try:
 #         # Initialiser le modèle vision si nécessaire
@@ -2,6 +2,12 @@ import streamlit as st
 from . import utils # Importation des fonctions utilitaires d'extraction
 from . import config # Pour la taille max des fichiers
 
+# Cache disque optionnel du texte extrait (partagé entre sessions, processus et redémarrages)
+try:
+    from diskcache import Cache
+except ImportError:
+    Cache = None
+
 # Types de fichiers acceptés et leurs fonctions d'extraction associées
 SUPPORTED_FILE_TYPES = {
     "pdf": utils.extract_text_from_pdf,
@@ -13,6 +19,13 @@ SUPPORTED_FILE_TYPES = {
 # Extensions autorisées pour l'upload
 ALLOWED_EXTENSIONS = list(SUPPORTED_FILE_TYPES.keys())
 
+# Nombre d'octets du début du fichier utilisés pour l'empreinte (suffisant pour distinguer
+# deux documents, sans hacher intégralement un fichier de 100 MB à chaque rerun)
+DOCUMENT_KEY_PREFIX_BYTES = 1_000_000
+
+# Taille maximale en octets, calculée une seule fois (comparaison entière à chaque rerun)
+_MAX_BYTES = config.MAX_FILE_SIZE_MB * 1024 * 1024
+
 def display_file_uploader() -> st.runtime.uploaded_file_manager.UploadedFile | None:
     """
     Affiche le widget Streamlit pour l'upload de fichiers et retourne le fichier uploadé.
@@ -30,18 +43,88 @@ def display_file_uploader() -> st.runtime.uploaded_file_manager.UploadedFile | N
 
     if uploaded_file is not None:
         # Validation de la taille (Streamlit gère aussi maxUploadSize dans config.toml)
-        file_size_mb = uploaded_file.size / (1024 * 1024)
-        if file_size_mb > config.MAX_FILE_SIZE_MB:
-            st.error(f"Le fichier est trop volumineux ({file_size_mb:.2f} MB). La taille maximale autorisée est {config.MAX_FILE_SIZE_MB} MB.", icon="🚨")
+        if uploaded_file.size > _MAX_BYTES:
+            st.error(f"Le fichier est trop volumineux ({uploaded_file.size / 1048576:.2f} MB). La taille maximale autorisée est {config.MAX_FILE_SIZE_MB} MB.", icon="🚨")
             return None # Retourne None si le fichier est trop gros
 
         # Afficher une information sur le fichier chargé
-        st.info(f"Fichier chargé : `{uploaded_file.name}` ({uploaded_file.type}, {file_size_mb:.2f} MB)", icon="📁")
+        st.info(f"Fichier chargé : `{uploaded_file.name}` ({uploaded_file.type}, {uploaded_file.size / 1048576:.2f} MB)", icon="📁")
         return uploaded_file
     else:
         # st.info("Veuillez charger un document pour commencer.") # Message optionnel
         return None
 
+def get_document_key(uploaded_file: st.runtime.uploaded_file_manager.UploadedFile) -> tuple[str, int, str]:
+    """
+    Calcule une clé identifiant le contenu du fichier uploadé (et non seulement son nom).
+
+    Args:
+        uploaded_file: L'objet fichier retourné par st.file_uploader.
+
+    Returns:
+        tuple: (nom, taille, empreinte BLAKE2b du premier Mo du contenu).
+    """
+    head = uploaded_file.getbuffer()[:DOCUMENT_KEY_PREFIX_BYTES] # Vue mémoire, sans copie
+    return (uploaded_file.name, uploaded_file.size, utils.content_hash(head))
+
+@st.cache_resource(show_spinner=False)
+def _get_text_disk_cache():
+    """Retourne le cache disque du texte extrait (None si diskcache n'est pas installé)."""
+    if Cache is None:
+        return None
+    try:
+        return Cache(config.TEXT_DISK_CACHE_DIR, size_limit=config.TEXT_DISK_CACHE_SIZE_LIMIT)
+    except Exception as e:
+        st.warning(f"Cache disque du texte extrait indisponible : {e}", icon="⚠️")
+        return None
+
+def _full_content_hash(file_content) -> str:
+    """Empreinte BLAKE2b de l'intégralité du contenu (vue mémoire sur le flux, sans copie)."""
+    if hasattr(file_content, 'getbuffer'):
+        with file_content.getbuffer() as view:
+            return utils.content_hash(view)
+    return utils.content_hash(utils._as_bytes(file_content))
+
+def _extract_text_persistent(file_extension: str, file_content) -> str | None:
+    """
+    Extrait le texte en passant par le cache disque : un document déjà traité (même contenu,
+    quelle que soit la session ou le processus) est relu au lieu d'être ré-analysé.
+
+    Args:
+        file_extension (str): L'extension du fichier (clé de SUPPORTED_FILE_TYPES).
+        file_content: Les bytes ou le flux binaire du fichier.
+
+    Returns:
+        str: Le texte extrait, ou None si l'extraction échoue.
+    """
+    disk_cache = _get_text_disk_cache()
+    if disk_cache is None:
+        return SUPPORTED_FILE_TYPES[file_extension](file_content)
+
+    # Empreinte du contenu complet (et non du seul premier Mo comme get_document_key) :
+    # calculée seulement en cas d'absence du cache mémoire, elle reste négligeable face au parsing
+    cache_key = (file_extension, _full_content_hash(file_content))
+    cached = disk_cache.get(cache_key)
+    if cached is not None:
+        return cached
+
+    text = SUPPORTED_FILE_TYPES[file_extension](file_content)
+    if text: # Ne pas mémoriser les échecs d'extraction
+        disk_cache.set(cache_key, text)
+    return text
+
+@st.cache_data(show_spinner=False, max_entries=8, ttl=3600)
+def _extract_text_cached(document_key: tuple, file_extension: str, _file_content) -> str | None:
+    """
+    Extraction mise en cache sur la clé du document (le contenu est exclu du hachage).
+
+    La clé contient déjà une empreinte BLAKE2b du contenu (`get_document_key`) : Streamlit
+    ne parcourt jamais les octets du fichier, aucun `hash_funcs` n'est nécessaire.
+    En cas d'absence, le cache disque (`_extract_text_persistent`) est consulté avant le parsing.
+    Un échec est retiré du cache par l'appelant, `extract_text_from_uploaded_file`.
+    """
+    return _extract_text_persistent(file_extension, _file_content)
+
 def extract_text_from_uploaded_file(uploaded_file: st.runtime.uploaded_file_manager.UploadedFile) -> str | None:
     """
     Extrait le texte du fichier uploadé en utilisant la fonction appropriée basée sur son extension.
@@ -55,17 +138,21 @@ def extract_text_from_uploaded_file(uploaded_file: st.runtime.uploaded_file_mana
     if uploaded_file is None:
         return None
 
-    file_extension = utils.get_file_extension(uploaded_file.name)
+    # Un seul appel C (rpartition) au lieu de passer par utils.get_file_extension
+    _, dot, extension = uploaded_file.name.rpartition('.')
+    file_extension = extension.lower() if dot else None
 
     if file_extension in SUPPORTED_FILE_TYPES:
-        # Lire le contenu du fichier en bytes
-        file_content = uploaded_file.getvalue()
-
         # Afficher une barre de progression pendant l'extraction (peut être rapide)
         with st.spinner(f"Extraction du texte du fichier {file_extension.upper()}..."):
-            extraction_function = SUPPORTED_FILE_TYPES[file_extension]
             try:
-                extracted_text = extraction_function(file_content)
+                # Un même fichier rechargé réutilise le texte déjà extrait
+                # Le fichier est passé comme flux (lu par l'extracteur) plutôt que copié via getvalue()
+                document_key = get_document_key(uploaded_file)
+                extracted_text = _extract_text_cached(document_key, file_extension, uploaded_file)
+                if not extracted_text:
+                    # Streamlit mémorise la valeur au retour de la fonction : retirer uniquement cette entrée
+                    _extract_text_cached.clear(document_key, file_extension, uploaded_file)
                 if extracted_text:
                     st.success(f"Texte extrait avec succès du fichier {uploaded_file.name}.", icon="✅")
                     # Nettoyage optionnel du texte extrait
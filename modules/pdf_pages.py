@@ -0,0 +1,24 @@
+# Extraction PyMuPDF exécutée dans les processus fils de utils._pymupdf_pages_text_parallel.
+# Module volontairement minimal (ni Streamlit ni autres modules de l'application) : un processus
+# 'spawn' n'importe que ce fichier et PyMuPDF, et lit le PDF depuis un fichier partagé au lieu
+# de recevoir une copie sérialisée du contenu.
+
+
+def pages_text(path: str, start: int, stop: int) -> list[str]:
+    """
+    Extrait le texte des pages [start, stop) d'un PDF enregistré sur disque.
+
+    Args:
+        path (str): Chemin du fichier PDF (fichier temporaire partagé entre les processus).
+        start (int): Index de la première page.
+        stop (int): Index suivant la dernière page.
+
+    Returns:
+        list[str]: Le texte de chaque page de la plage, dans l'ordre.
+    """
+    import fitz
+    document = fitz.open(path)
+    try:
+        return [document.load_page(i).get_text("text") for i in range(start, stop)]
+    finally:
+        document.close()
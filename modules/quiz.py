@@ -1,6 +1,8 @@
 import streamlit as st
+from streamlit.runtime.scriptrunner import get_script_run_ctx
 import json
-import random
+import numpy as np
+import orjson
 import re # Pour le nettoyage potentiel du JSON
 from . import gemini_client
 from . import config
@@ -15,16 +17,101 @@ QUIZ_FEEDBACK_KEY = "quiz_feedback"
 QUIZ_GENERATED_KEY = "quiz_generated"
 LAST_QUIZ_RAW_RESPONSE_KEY = "last_quiz_raw_response"
 DOCUMENT_CONTEXT_KEY = "document_text" # Assumer que le texte du doc est ici
+DOCUMENT_HASH_KEY = "document_hash" # Empreinte du document (utils.content_hash), calculée au chargement
+
+# Générateur aléatoire partagé pour mélanger les questions (permutation calculée en C)
+_rng = np.random.default_rng()
+
+# Liste JSON de la réponse : dans un bloc ```json ... ``` ou directement du premier `[` au dernier `]`
+_JSON_ARRAY_RE = re.compile(r"```(?:json)?\s*(\[.*\])\s*```|(\[.*\])", re.DOTALL)
+
+# --- Modèles de prompt pour la génération de quiz (construits une seule fois à l'import) ---
+_QUIZ_PROMPT_HEADER = """Objectif : Générer un quiz de {num} questions de type '{type_desc}' (difficulté: {diff_desc}) basé **strictement** sur le document suivant.
+--- DEBUT DOCUMENT ---
+{doc}
+--- FIN DOCUMENT ---{truncated}
+
+--- FORMAT DE SORTIE EXIGE ---
+1. Réponds **UNIQUEMENT** avec une liste JSON valide commençant par `[` et se terminant par `]`.
+2. N'ajoute **AUCUN** texte, commentaire, explication ou formatage (comme ```json) avant ou après la liste JSON.
+3. Assure-toi que chaque objet JSON dans la liste est séparé par une virgule `,` (sauf le dernier).
+4. Assure-toi que toutes les chaînes de caractères dans le JSON sont correctement échappées (guillemets doubles `"`).
+5. La structure de chaque objet JSON dépend du type de quiz demandé :"""
+
+# Bloc spécifique au type de quiz (concaténé tel quel, pas de format : les accolades sont littérales)
+_QUIZ_PROMPT_TYPE_MAP = {
+    "QCM": """
+   Pour QCM : `{ "question": "...", "options": ["...", "...", ...], "correct_answer": "...", "explanation": "..." }`
+   - 'options' doit être une liste d'au moins 3 chaînes.
+   - 'correct_answer' doit correspondre EXACTEMENT à l'une des chaînes dans 'options'.""",
+    "Vrai/Faux": """
+   Pour Vrai/Faux : `{ "question": "...", "correct_answer": true/false, "explanation": "..." }`
+   - 'correct_answer' doit être un booléen JSON (`true` ou `false`, sans guillemets).""",
+    "Ouvertes": """
+   Pour Ouvertes : `{ "question": "...", "ideal_answer_points": ["...", "...", ...], "explanation": "..." }`
+   - 'ideal_answer_points' est une liste de chaînes décrivant les points clés attendus.""",
+}
+
+_QUIZ_PROMPT_FOOTER = """
+
+--- EXEMPLE (pour QCM) ---
+
+[
+  {{"question": "Exemple Q1?", "options": ["A", "B", "C"], "correct_answer": "B", "explanation": "Expl. Q1"}},
+  {{"question": "Exemple Q2?", "options": ["X", "Y", "Z"], "correct_answer": "X", "explanation": "Expl. Q2"}}
+]
+
+
+--- IMPORTANT ---
+Génère exactement {num} questions. Commence ta réponse directement par `[`."""
+
+# Prompt complet assemblé à l'import ; le bloc du type est inséré comme valeur (ses accolades ne sont pas interprétées)
+_QUIZ_PROMPT_TEMPLATE = _QUIZ_PROMPT_HEADER + "{type_block}" + _QUIZ_PROMPT_FOOTER
+
+# Prompt d'évaluation d'une réponse ouverte
+_EVAL_PROMPT_TEMPLATE = """Rôle : Tu es un assistant pédagogique chargé d'évaluer la réponse d'un utilisateur à une question ouverte, en te basant **strictement** sur les points clés attendus et le contexte du document fourni.
+
+--- CONTEXTE DU DOCUMENT (Source de vérité) ---
+{context}
+--- FIN DU CONTEXTE ---
+
+--- QUESTION POSÉE ---
+{question}
+
+--- POINTS CLÉS ATTENDUS DANS LA RÉPONSE IDÉALE ---
+{points}
+
+--- EXPLICATION/CONTEXTE DE LA QUESTION (si disponible) ---
+{explanation}
+
+--- RÉPONSE DE L'UTILISATEUR À ÉVALUER ---
+{answer}
+
+--- INSTRUCTIONS D'ÉVALUATION ---
+1. Compare la réponse de l'utilisateur aux points clés attendus ET au contexte du document.
+2. Évalue la pertinence, l'exactitude et la complétude de la réponse.
+3. Fournis un feedback constructif et détaillé en français.
+4. Commence ton feedback par une appréciation générale (ex: 'Correct.', 'Partiellement correct.', 'Incorrect.', 'Bonne tentative, mais...').
+5. Explique pourquoi la réponse est correcte/incorrecte/partielle, en citant si possible des éléments du contexte ou des points clés.
+6. Si la réponse est proche mais manque des éléments, suggère des améliorations ou les points manquants.
+7. Sois concis mais précis.
+
+--- FEEDBACK DÉTAILLÉ (Commence ici) ---"""
+
+# Réponse attendue pour l'évaluation groupée des questions ouvertes : un feedback par question
+OPEN_FEEDBACK_RESPONSE_SCHEMA = {"type": "array", "items": {"type": "string"}}
 
 # --- Fonctions de Génération (generate_quiz_questions reste identique à la version précédente) ---
 def generate_quiz_questions(text: str,
                             num_questions: int = 5,
                             quiz_type: str = "QCM",
                             difficulty: str = "Moyen",
-                            model_name: str = config.DEFAULT_TEXT_MODEL_NAME) -> list | None:
+                            model_name: str = config.DEFAULT_TEXT_MODEL_NAME,
+                            text_hash: str | None = None) -> list | None:
     """
     Génère une liste de questions de quiz basées sur le texte fourni.
     (Identique à la version précédente avec prompt amélioré)
+    `text_hash` : empreinte du texte (`utils.content_hash`) si elle est déjà connue.
     """
     if not text:
         st.warning("Le texte source pour le quiz est vide.", icon="⚠️")
@@ -34,54 +121,23 @@ def generate_quiz_questions(text: str,
          st.error("Impossible de générer le quiz car le client Gemini n'est pas configuré.", icon="❌")
          return None
 
-    quiz_type_desc = config.QUIZ_TYPES.get(quiz_type, "Questions à Choix Multiples")
-    difficulty_desc = config.QUIZ_DIFFICULTY.get(difficulty, "moyen")
-
     # Limiter la taille du contexte pour la génération (évite erreurs/coûts excessifs)
     max_gen_context = 10000
     context_truncated = len(text) > max_gen_context
-    text_for_prompt = text[:max_gen_context]
-
-    prompt_parts = [
-        f"Objectif : Générer un quiz de {num_questions} questions de type '{quiz_type_desc}' (difficulté: {difficulty_desc}) basé **strictement** sur le document suivant.",
-        "--- DEBUT DOCUMENT ---",
-        text_for_prompt,
-        "--- FIN DOCUMENT ---" + (" (TRONQUÉ)" if context_truncated else ""),
-        "\n--- FORMAT DE SORTIE EXIGE ---",
-        "1. Réponds **UNIQUEMENT** avec une liste JSON valide commençant par `[` et se terminant par `]`.",
-        "2. N'ajoute **AUCUN** texte, commentaire, explication ou formatage (comme ```json) avant ou après la liste JSON.",
-        "3. Assure-toi que chaque objet JSON dans la liste est séparé par une virgule `,` (sauf le dernier).",
-        "4. Assure-toi que toutes les chaînes de caractères dans le JSON sont correctement échappées (guillemets doubles `\"`).",
-        "5. La structure de chaque objet JSON dépend du type de quiz demandé :"
-    ]
-    if quiz_type == "QCM":
-        prompt_parts.extend([
-            "   Pour QCM : `{ \"question\": \"...\", \"options\": [\"...\", \"...\", ...], \"correct_answer\": \"...\", \"explanation\": \"...\" }`",
-            "   - 'options' doit être une liste d'au moins 3 chaînes.",
-            "   - 'correct_answer' doit correspondre EXACTEMENT à l'une des chaînes dans 'options'."
-        ])
-    elif quiz_type == "Vrai/Faux":
-        prompt_parts.extend([
-            "   Pour Vrai/Faux : `{ \"question\": \"...\", \"correct_answer\": true/false, \"explanation\": \"...\" }`",
-            "   - 'correct_answer' doit être un booléen JSON (`true` ou `false`, sans guillemets)."
-        ])
-    elif quiz_type == "Ouvertes":
-        prompt_parts.extend([
-            "   Pour Ouvertes : `{ \"question\": \"...\", \"ideal_answer_points\": [\"...\", \"...\", ...], \"explanation\": \"...\" }`",
-            "   - 'ideal_answer_points' est une liste de chaînes décrivant les points clés attendus."
-        ])
-    prompt_parts.append("\n--- EXEMPLE (pour QCM) ---")
-    prompt_parts.append("""
-[
-  {"question": "Exemple Q1?", "options": ["A", "B", "C"], "correct_answer": "B", "explanation": "Expl. Q1"},
-  {"question": "Exemple Q2?", "options": ["X", "Y", "Z"], "correct_answer": "X", "explanation": "Expl. Q2"}
-]
-""")
-    prompt_parts.append("\n--- IMPORTANT ---")
-    prompt_parts.append(f"Génère exactement {num_questions} questions. Commence ta réponse directement par `[`.")
-    full_prompt = "\n".join(prompt_parts)
+    text_hash = text_hash or utils.content_hash(text)
+    text_for_prompt = _truncated_context(text, max_gen_context, text_hash=text_hash)
 
-    response = gemini_client.generate_text(prompt=full_prompt, model_name=model_name, temperature=0.4, max_output_tokens=3072)
+    if st.session_state.get(gemini_client.BYPASS_CACHE_KEY, False):
+        response = _request_quiz(text_for_prompt, context_truncated, num_questions, quiz_type, difficulty, model_name)
+    else:
+        # Même document et mêmes paramètres (ex. double clic) : ni prompt ni appel à l'IA
+        response = _request_quiz_cached(text_hash, num_questions, quiz_type, difficulty, model_name,
+                                        text_for_prompt, context_truncated)
+        if not response:
+            # Streamlit mémorise la valeur au retour de la fonction : retirer uniquement cette entrée
+            # (un clear() dans la fonction en cache n'empêcherait pas le stockage et viderait tout le cache)
+            _request_quiz_cached.clear(text_hash, num_questions, quiz_type, difficulty, model_name,
+                                       text_for_prompt, context_truncated)
     st.session_state[LAST_QUIZ_RAW_RESPONSE_KEY] = response
 
     if not response:
@@ -89,19 +145,14 @@ def generate_quiz_questions(text: str,
         return None
 
     try:
-        processed_response = response.strip()
-        if processed_response.startswith("```json"): processed_response = processed_response[7:]
-        if processed_response.startswith("```"): processed_response = processed_response[3:]
-        if processed_response.endswith("```"): processed_response = processed_response[:-3]
-        processed_response = processed_response.strip()
-        json_start = processed_response.find('[')
-        json_end = processed_response.rfind(']') + 1
-        if json_start == -1 or json_end == -1:
+        # Un seul parcours de la réponse (au lieu de strip/startswith/endswith/find/rfind)
+        match = _JSON_ARRAY_RE.search(response)
+        json_str = (match.group(1) or match.group(2)) if match else None
+        if json_str is None:
             st.error("Erreur Format JSON : Impossible d'extraire une liste JSON (`[...]`) de la réponse de l'IA.", icon="❌")
             return None
 
-        json_str = processed_response[json_start:json_end]
-        quiz_data = json.loads(json_str)
+        quiz_data = orjson.loads(json_str) # orjson accepte directement une str
 
         if not isinstance(quiz_data, list) or len(quiz_data) == 0:
             st.error("Erreur Format JSON : L'IA n'a pas retourné une liste de questions valide.", icon="❌")
@@ -120,10 +171,16 @@ def generate_quiz_questions(text: str,
              return None
 
         st.success(f"Quiz de {len(quiz_data)} questions ({quiz_type}) généré avec succès !", icon="🧠")
-        random.shuffle(quiz_data)
+        quiz_data = [quiz_data[i] for i in _rng.permutation(len(quiz_data)).tolist()]
+        # Type détecté une seule fois, à la génération, puis réutilisé par l'affichage et les exports
+        for q in quiz_data:
+            q['type'] = detect_quiz_type(q)
+        # Réponses et feedback : listes préallouées, indexées par question (None tant que non répondue)
+        st.session_state[QUIZ_ANSWERS_KEY] = [None] * len(quiz_data)
+        st.session_state[QUIZ_FEEDBACK_KEY] = [None] * len(quiz_data)
         return quiz_data
 
-    except json.JSONDecodeError as e:
+    except (orjson.JSONDecodeError, json.JSONDecodeError) as e:
         st.error(f"Erreur de décodage JSON : L'IA a retourné un format invalide. Détails : {e}", icon="❌")
         return None
     except Exception as e:
@@ -131,9 +188,33 @@ def generate_quiz_questions(text: str,
         return None
 
 
+def _request_quiz(text_for_prompt: str, context_truncated: bool, num_questions: int, quiz_type: str,
+                  difficulty: str, model_name: str) -> str | None:
+    """Construit le prompt de génération du quiz et retourne la réponse brute de Gemini."""
+    quiz_type_desc = config.QUIZ_TYPES.get(quiz_type, "Questions à Choix Multiples")
+    difficulty_desc = config.QUIZ_DIFFICULTY.get(difficulty, "moyen")
+
+    # Un seul format() : l'extrait du document n'est copié qu'une fois dans le prompt final
+    full_prompt = _QUIZ_PROMPT_TEMPLATE.format(num=num_questions, type_desc=quiz_type_desc, diff_desc=difficulty_desc,
+                                               doc=text_for_prompt, truncated=" (TRONQUÉ)" if context_truncated else "",
+                                               type_block=_QUIZ_PROMPT_TYPE_MAP.get(quiz_type, ""))
+
+    return gemini_client.generate_text(prompt=full_prompt, model_name=model_name, temperature=0.4, max_output_tokens=3072)
+
+@st.cache_data(show_spinner=False, ttl=1800, max_entries=32)
+def _request_quiz_cached(text_hash: str, num_questions: int, quiz_type: str, difficulty: str, model_name: str,
+                         _text_for_prompt: str, _context_truncated: bool) -> str | None:
+    """
+    Réponse brute mise en cache sur l'empreinte du document et les paramètres (l'extrait est exclu du hachage).
+    Un échec (None) est retiré du cache par l'appelant, `generate_quiz_questions`.
+    """
+    return _request_quiz(_text_for_prompt, _context_truncated, num_questions, quiz_type, difficulty, model_name)
+
+
 # --- Nouvelle Fonction pour évaluer les réponses ouvertes ---
 # @st.cache_data # Attention au cache ici, l'évaluation peut dépendre de l'état actuel
-def evaluate_open_ended_answer(user_answer: str, question_data: dict, document_context: str | None) -> str:
+def evaluate_open_ended_answer(user_answer: str, question_data: dict, document_context: str | None,
+                               text_hash: str | None = None) -> str:
     """
     Évalue une réponse ouverte en utilisant Gemini et retourne le feedback.
 
@@ -141,6 +222,7 @@ def evaluate_open_ended_answer(user_answer: str, question_data: dict, document_c
         user_answer (str): La réponse fournie par l'utilisateur.
         question_data (dict): Les données de la question (incluant 'question' et 'ideal_answer_points').
         document_context (str | None): Le contexte du document original.
+        text_hash (str | None): Empreinte du document (`utils.content_hash`) si elle est déjà connue.
 
     Returns:
         str: Le feedback généré par l'IA.
@@ -156,73 +238,162 @@ def evaluate_open_ended_answer(user_answer: str, question_data: dict, document_c
     explanation = question_data.get('explanation', '') # Contexte additionnel de la question
 
     # Préparer le contexte (limité pour l'évaluation)
-    eval_context = ""
-    if document_context:
-        # Stratégie simple : prendre un extrait autour de mots clés de la question ?
-        # Ou juste les N premiers caractères comme pour le chat ? Prenons une limite raisonnable.
-        max_eval_context = 4000
-        eval_context = document_context[:max_eval_context]
-        if len(document_context) > max_eval_context:
-             eval_context += "\n[... CONTEXTE TRONQUÉ ...]"
-
-    # Construire le prompt d'évaluation
+    eval_context = _eval_context(document_context, text_hash)
+
+    # Construire le prompt d'évaluation (un seul format(), sans liste intermédiaire)
+    full_prompt = _EVAL_PROMPT_TEMPLATE.format(
+        context=eval_context if eval_context else "[Aucun contexte fourni]",
+        question=question_text,
+        points="- " + "\n- ".join(ideal_points) if ideal_points else "[Aucun point clé spécifié]",
+        explanation=explanation if explanation else "[Aucune]",
+        answer=user_answer,
+    )
+
+    # Appeler Gemini pour l'évaluation
+    feedback_response = gemini_client.generate_text(
+        prompt=full_prompt,
+        temperature=0.5, # Équilibré pour l'évaluation
+        max_output_tokens=512 # Assez pour un feedback détaillé
+    )
+
+    if feedback_response:
+        return feedback_response.strip()
+    else:
+        return "[Erreur lors de la génération du feedback par l'IA]"
+
+
+def _truncated_context(text: str, limit: int, marker: str = "", text_hash: str | None = None) -> str:
+    """
+    Retourne les `limit` premiers caractères du texte, suivis de `marker` s'il a été tronqué.
+    L'extrait est calculé une seule fois par document et par limite (cache indexé sur l'empreinte).
+
+    Args:
+        text (str): Le texte du document.
+        limit (int): Nombre maximum de caractères conservés.
+        marker (str): Indication ajoutée à la fin de l'extrait si le texte dépasse la limite.
+        text_hash (str | None): Empreinte du texte (`utils.content_hash`) si elle est déjà connue.
+
+    Returns:
+        str: L'extrait du document.
+    """
+    return _truncated_context_cached(text_hash or utils.content_hash(text), limit, marker, text)
+
+@st.cache_data(show_spinner=False, max_entries=32)
+def _truncated_context_cached(text_hash: str, limit: int, marker: str, _text: str) -> str:
+    # Le texte est exclu du hachage de Streamlit (préfixe '_') : la clé est son empreinte
+    return _text[:limit] + marker if len(_text) > limit else _text
+
+def _eval_context(document_context: str | None, text_hash: str | None = None) -> str:
+    """Extrait du document utilisé comme source de vérité pour l'évaluation des réponses ouvertes."""
+    if not document_context:
+        return ""
+    # Stratégie simple : prendre un extrait autour de mots clés de la question ?
+    # Ou juste les N premiers caractères comme pour le chat ? Prenons une limite raisonnable.
+    max_eval_context = 4000
+    return _truncated_context(document_context, max_eval_context, "\n[... CONTEXTE TRONQUÉ ...]", text_hash)
+
+
+def evaluate_open_ended_answers_batch(items: list[tuple[str, dict]], document_context: str | None,
+                                      text_hash: str | None = None) -> list[str]:
+    """
+    Évalue plusieurs réponses ouvertes en un seul appel à Gemini (contexte du document envoyé une fois).
+    En cas de réponse inexploitable (JSON invalide, nombre de feedbacks incorrect), chaque réponse
+    est évaluée individuellement avec evaluate_open_ended_answer.
+
+    Args:
+        items (list[tuple[str, dict]]): Paires (réponse de l'utilisateur, données de la question).
+        document_context (str | None): Le contexte du document original.
+        text_hash (str | None): Empreinte du document (`utils.content_hash`) si elle est déjà connue.
+
+    Returns:
+        list[str]: Un feedback par paire, dans le même ordre.
+    """
+    if len(items) <= 1 or not gemini_client.configure_gemini():
+        return [evaluate_open_ended_answer(user_answer, question_data, document_context, text_hash) for user_answer, question_data in items]
+
+    eval_context = _eval_context(document_context, text_hash)
     prompt_parts = [
-        "Rôle : Tu es un assistant pédagogique chargé d'évaluer la réponse d'un utilisateur à une question ouverte, en te basant **strictement** sur les points clés attendus et le contexte du document fourni.",
+        f"Rôle : Tu es un assistant pédagogique chargé d'évaluer les réponses d'un utilisateur à {len(items)} questions ouvertes, en te basant **strictement** sur les points clés attendus et le contexte du document fourni.",
         "\n--- CONTEXTE DU DOCUMENT (Source de vérité) ---",
         eval_context if eval_context else "[Aucun contexte fourni]",
         "--- FIN DU CONTEXTE ---",
-        "\n--- QUESTION POSÉE ---",
-        question_text,
-        "\n--- POINTS CLÉS ATTENDUS DANS LA RÉPONSE IDÉALE ---",
-        "- " + "\n- ".join(ideal_points) if ideal_points else "[Aucun point clé spécifié]",
-        f"\n--- EXPLICATION/CONTEXTE DE LA QUESTION (si disponible) ---",
-        explanation if explanation else "[Aucune]",
-        "\n--- RÉPONSE DE L'UTILISATEUR À ÉVALUER ---",
-        user_answer,
-        "\n--- INSTRUCTIONS D'ÉVALUATION ---",
-        "1. Compare la réponse de l'utilisateur aux points clés attendus ET au contexte du document.",
-        "2. Évalue la pertinence, l'exactitude et la complétude de la réponse.",
-        "3. Fournis un feedback constructif et détaillé en français.",
-        "4. Commence ton feedback par une appréciation générale (ex: 'Correct.', 'Partiellement correct.', 'Incorrect.', 'Bonne tentative, mais...').",
-        "5. Explique pourquoi la réponse est correcte/incorrecte/partielle, en citant si possible des éléments du contexte ou des points clés.",
-        "6. Si la réponse est proche mais manque des éléments, suggère des améliorations ou les points manquants.",
-        "7. Sois concis mais précis.",
-        "\n--- FEEDBACK DÉTAILLÉ (Commence ici) ---"
     ]
+    for number, (user_answer, question_data) in enumerate(items, start=1):
+        ideal_points = question_data.get('ideal_answer_points', [])
+        prompt_parts.extend([
+            f"\n=== QUESTION {number} ===",
+            question_data.get('question', ''),
+            "--- POINTS CLÉS ATTENDUS ---",
+            "- " + "\n- ".join(ideal_points) if ideal_points else "[Aucun point clé spécifié]",
+            "--- EXPLICATION/CONTEXTE DE LA QUESTION ---",
+            question_data.get('explanation', '') or "[Aucune]",
+            "--- RÉPONSE DE L'UTILISATEUR ---",
+            user_answer,
+        ])
+    prompt_parts.extend([
+        "\n--- INSTRUCTIONS D'ÉVALUATION ---",
+        "1. Pour chaque question, compare la réponse de l'utilisateur aux points clés attendus ET au contexte du document.",
+        "2. Évalue la pertinence, l'exactitude et la complétude de chaque réponse.",
+        "3. Fournis pour chacune un feedback constructif et détaillé en français, concis mais précis.",
+        "4. Commence chaque feedback par une appréciation générale (ex: 'Correct.', 'Partiellement correct.', 'Incorrect.', 'Bonne tentative, mais...').",
+        "5. Explique pourquoi la réponse est correcte/incorrecte/partielle et suggère les points manquants si nécessaire.",
+        f"6. Réponds avec une liste JSON de exactement {len(items)} chaînes : un feedback par question, dans l'ordre des questions.",
+    ])
     full_prompt = "\n".join(prompt_parts)
 
-    # Appeler Gemini pour l'évaluation
     feedback_response = gemini_client.generate_text(
         prompt=full_prompt,
         temperature=0.5, # Équilibré pour l'évaluation
-        max_output_tokens=512 # Assez pour un feedback détaillé
+        max_output_tokens=512 * len(items), # Même budget par question que l'évaluation individuelle
+        response_schema=OPEN_FEEDBACK_RESPONSE_SCHEMA
     )
 
+    feedbacks = None
     if feedback_response:
-        return feedback_response.strip()
-    else:
-        return "[Erreur lors de la génération du feedback par l'IA]"
+        try:
+            feedbacks = orjson.loads(feedback_response)
+        except orjson.JSONDecodeError:
+            feedbacks = None
+    if isinstance(feedbacks, list) and len(feedbacks) == len(items) and all(isinstance(fb, str) for fb in feedbacks):
+        return [fb.strip() or "[Erreur lors de la génération du feedback par l'IA]" for fb in feedbacks]
+
+    # Repli : évaluation question par question
+    return [evaluate_open_ended_answer(user_answer, question_data, document_context, text_hash) for user_answer, question_data in items]
+
+
+def _evaluate_pending_open_answers(questions: list, answers: list, feedback: list, document_context: str | None,
+                                   text_hash: str | None = None) -> None:
+    """Évalue en un seul lot les réponses ouvertes du quiz qui n'ont pas encore de feedback."""
+    pending = [i for i, question_data in enumerate(questions)
+               if answers[i] is not None and feedback[i] is None and get_question_type(question_data) == "Ouvertes"]
+    if not pending:
+        return
+    with st.spinner("Évaluation des réponses ouvertes par l'IA..."):
+        feedback_texts = evaluate_open_ended_answers_batch([(answers[i], questions[i]) for i in pending], document_context, text_hash)
+    for i, feedback_text in zip(pending, feedback_texts):
+        feedback[i] = (None, feedback_text) # is_correct reste None pour les questions ouvertes
 
 
 # --- Fonctions d'initialisation et d'options (inchangées) ---
 def initialize_quiz_state():
     if QUIZ_QUESTIONS_KEY not in st.session_state: st.session_state[QUIZ_QUESTIONS_KEY] = []
-    if QUIZ_ANSWERS_KEY not in st.session_state: st.session_state[QUIZ_ANSWERS_KEY] = {}
+    if QUIZ_ANSWERS_KEY not in st.session_state: st.session_state[QUIZ_ANSWERS_KEY] = []
     if QUIZ_SCORE_KEY not in st.session_state: st.session_state[QUIZ_SCORE_KEY] = 0
     if QUIZ_CURRENT_QUESTION_KEY not in st.session_state: st.session_state[QUIZ_CURRENT_QUESTION_KEY] = 0
-    if QUIZ_FEEDBACK_KEY not in st.session_state: st.session_state[QUIZ_FEEDBACK_KEY] = {}
+    if QUIZ_FEEDBACK_KEY not in st.session_state: st.session_state[QUIZ_FEEDBACK_KEY] = []
     if QUIZ_GENERATED_KEY not in st.session_state: st.session_state[QUIZ_GENERATED_KEY] = False
     if LAST_QUIZ_RAW_RESPONSE_KEY not in st.session_state: st.session_state[LAST_QUIZ_RAW_RESPONSE_KEY] = None
     # Assurer que la clé pour le contexte existe aussi
     if DOCUMENT_CONTEXT_KEY not in st.session_state: st.session_state[DOCUMENT_CONTEXT_KEY] = None
+    if DOCUMENT_HASH_KEY not in st.session_state: st.session_state[DOCUMENT_HASH_KEY] = None
 
 
 def reset_quiz_state():
     st.session_state[QUIZ_QUESTIONS_KEY] = []
-    st.session_state[QUIZ_ANSWERS_KEY] = {}
+    st.session_state[QUIZ_ANSWERS_KEY] = []
     st.session_state[QUIZ_SCORE_KEY] = 0
     st.session_state[QUIZ_CURRENT_QUESTION_KEY] = 0
-    st.session_state[QUIZ_FEEDBACK_KEY] = {}
+    st.session_state[QUIZ_FEEDBACK_KEY] = []
     st.session_state[QUIZ_GENERATED_KEY] = False
     st.session_state[LAST_QUIZ_RAW_RESPONSE_KEY] = None
 
@@ -256,30 +427,95 @@ def display_quiz_options(text_available: bool):
 
 # --- Fonctions d'affichage et d'évaluation (modifiées pour évaluation ouverte) ---
 
+# Bits de présence utilisés par detect_quiz_type
+_HAS_OPTIONS = 1        # 'options' est une liste
+_HAS_CORRECT = 2        # 'correct_answer' est présente
+_HAS_CORRECT_BOOL = 4   # 'correct_answer' est un booléen (ou 'true'/'false')
+_HAS_IDEAL_POINTS = 8   # 'ideal_answer_points' est une liste
+
+def _quiz_type_for_mask(mask: int) -> str:
+    """Règles de priorité de detect_quiz_type, évaluées une seule fois par combinaison de bits."""
+    if mask & _HAS_OPTIONS and mask & _HAS_CORRECT: return "QCM"
+    if mask & _HAS_CORRECT and mask & _HAS_CORRECT_BOOL: return "Vrai/Faux"
+    if mask & _HAS_IDEAL_POINTS: return "Ouvertes"
+    return "Inconnu"
+
+# Table précalculée : masque de présence -> type de question
+_QUIZ_TYPE_BY_MASK = tuple(_quiz_type_for_mask(mask) for mask in range(16))
+
 def detect_quiz_type(question_data: dict) -> str:
-    """Détecte le type de question basé sur les clés présentes (version améliorée)."""
+    """Détecte le type de question basé sur les clés présentes (table de correspondance sur un masque de bits)."""
     if not isinstance(question_data, dict): return "Inconnu"
-    has_options = "options" in question_data and isinstance(question_data["options"], list)
-    has_correct_answer = "correct_answer" in question_data
-    has_ideal_points = "ideal_answer_points" in question_data and isinstance(question_data["ideal_answer_points"], list)
-    if has_options and has_correct_answer: return "QCM"
-    if has_correct_answer and isinstance(question_data["correct_answer"], bool): return "Vrai/Faux"
-    if has_correct_answer and isinstance(question_data["correct_answer"], str) and question_data["correct_answer"].lower() in ['true', 'false']: return "Vrai/Faux"
-    if has_ideal_points: return "Ouvertes"
-    return "Inconnu"
+    mask = 0
+    if isinstance(question_data.get("options"), list): mask |= _HAS_OPTIONS
+    if "correct_answer" in question_data:
+        mask |= _HAS_CORRECT
+        correct_answer = question_data["correct_answer"]
+        if isinstance(correct_answer, bool) or (isinstance(correct_answer, str) and correct_answer.lower() in ('true', 'false')):
+            mask |= _HAS_CORRECT_BOOL
+    if isinstance(question_data.get("ideal_answer_points"), list): mask |= _HAS_IDEAL_POINTS
+    return _QUIZ_TYPE_BY_MASK[mask]
+
+def get_question_type(question_data: dict) -> str:
+    """Retourne le type stocké à la génération ('type'), ou le détecte si absent."""
+    return question_data.get('type') or detect_quiz_type(question_data)
+
+# Réponses Vrai/Faux fournies sous forme de chaîne par l'IA -> booléen
+_BOOL_MAP = {'true': True, 'false': False, 'True': True, 'False': False}
+
+def grade_answer(question_data: dict, quiz_type: str, user_answer) -> bool | None:
+    """
+    Corrige la réponse à une question QCM ou Vrai/Faux.
+
+    Args:
+        question_data (dict): Les données de la question (incluant 'correct_answer').
+        quiz_type (str): Le type de la question ("QCM" ou "Vrai/Faux").
+        user_answer: La réponse de l'utilisateur (option choisie ou booléen).
 
+    Returns:
+        bool | None: True/False selon la correction, None si la question n'est pas corrigeable
+                     automatiquement (question ouverte, réponse attendue au format invalide).
+    """
+    correct_answer = question_data.get("correct_answer")
+    if quiz_type == "QCM":
+        return user_answer == correct_answer
+    if quiz_type == "Vrai/Faux":
+        correct_bool = None
+        if isinstance(correct_answer, bool): correct_bool = correct_answer
+        elif isinstance(correct_answer, str):
+            # Graphies usuelles trouvées sans allocation ; .lower() seulement pour les autres (ex. 'TRUE')
+            correct_bool = _BOOL_MAP.get(correct_answer)
+            if correct_bool is None: correct_bool = _BOOL_MAP.get(correct_answer.lower())
+        if correct_bool is not None: return user_answer == correct_bool
+    return None
+
+def _rerun_after_answer(next_index: int, total_questions: int):
+    """Relance le fragment du quiz pour la question suivante, ou toute l'application après la dernière."""
+    # scope="fragment" n'est accepté que pendant une relance du fragment (pas lors d'une exécution complète)
+    ctx = get_script_run_ctx()
+    in_fragment_run = bool(ctx and ctx.fragment_ids_this_run)
+    st.rerun(scope="fragment" if in_fragment_run and next_index < total_questions else "app")
+
+@st.fragment
 def display_quiz_interface():
-    """Affiche l'interface du quiz (questions, réponses, score)."""
+    """
+    Affiche l'interface du quiz (questions, réponses, score).
+    Fragment Streamlit : répondre à une question ne relance que cette fonction (st.rerun(scope="fragment")).
+    Seule la dernière réponse relance toute l'application, car les options d'export (app.py) n'apparaissent
+    qu'une fois le quiz terminé.
+    """
     initialize_quiz_state()
-    questions = st.session_state.get(QUIZ_QUESTIONS_KEY, [])
-    quiz_successfully_generated = st.session_state.get(QUIZ_GENERATED_KEY, False)
+    # Toutes les clés existent après initialize_quiz_state() : accès direct, une seule fois par clé
+    ss = st.session_state
+    questions = ss[QUIZ_QUESTIONS_KEY]
+    quiz_successfully_generated = ss[QUIZ_GENERATED_KEY]
 
     if not questions or not quiz_successfully_generated:
-        if not st.session_state.get(LAST_QUIZ_RAW_RESPONSE_KEY):
+        if not ss[LAST_QUIZ_RAW_RESPONSE_KEY]:
              st.info("Générez un quiz à partir d'un document pour commencer.", icon="💡")
         return
 
-    current_index = st.session_state.get(QUIZ_CURRENT_QUESTION_KEY, 0)
+    current_index = ss[QUIZ_CURRENT_QUESTION_KEY]
     total_questions = len(questions)
 
     if current_index >= total_questions:
@@ -289,7 +525,7 @@ def display_quiz_interface():
     st.progress((current_index + 1) / total_questions, text=f"Question {current_index + 1}/{total_questions}")
     question_data = questions[current_index]
     question_text = question_data.get("question", "Erreur: Texte de question manquant")
-    quiz_type = detect_quiz_type(question_data)
+    quiz_type = get_question_type(question_data)
 
     if quiz_type == "Inconnu":
          st.error(f"Erreur interne: Type de question non reconnu pour la question {current_index + 1}.", icon="🆘")
@@ -323,29 +559,18 @@ def display_quiz_interface():
              response_given = False
 
         if response_given:
-            st.session_state[QUIZ_ANSWERS_KEY][current_index] = user_answer
+            ss[QUIZ_ANSWERS_KEY][current_index] = user_answer
             is_correct = None # Reste None pour Ouvertes
             feedback_text = "Feedback non disponible."
 
             try:
                 if quiz_type == "QCM" or quiz_type == "Vrai/Faux":
                     correct_answer = question_data.get("correct_answer")
-                    # Évaluation QCM/VF (logique précédente)
-                    if quiz_type == "QCM":
-                        is_correct = (user_answer == correct_answer)
-                    elif quiz_type == "Vrai/Faux":
-                        correct_bool = None
-                        if isinstance(correct_answer, bool): correct_bool = correct_answer
-                        elif isinstance(correct_answer, str):
-                            if correct_answer.lower() == 'true': correct_bool = True
-                            elif correct_answer.lower() == 'false': correct_bool = False
-                        if correct_bool is not None: is_correct = (user_answer == correct_bool)
-                        else: explanation = f"[Erreur format réponse attendue: {correct_answer}] " + question_data.get('explanation', '')
+                    is_correct = grade_answer(question_data, quiz_type, user_answer)
 
                     # Générer feedback QCM/VF
                     explanation = question_data.get('explanation', 'Pas d\'explication.')
                     if is_correct is True:
-                        st.session_state[QUIZ_SCORE_KEY] += 1
                         feedback_text = f"✅ **Correct !** {explanation}"
                     elif is_correct is False:
                         correct_ans_display = correct_answer if not isinstance(correct_answer, bool) else ("Vrai" if correct_answer else "Faux")
@@ -353,28 +578,27 @@ def display_quiz_interface():
                     else: # Erreur format réponse correcte
                          feedback_text = f"⚠️ Impossible d'évaluer (format réponse attendue invalide). {explanation}"
 
-                elif quiz_type == "Ouvertes":
-                    # --- Appel à l'évaluation IA ---
-                    with st.spinner("Évaluation de la réponse par l'IA..."):
-                        document_context = st.session_state.get(DOCUMENT_CONTEXT_KEY)
-                        feedback_text = evaluate_open_ended_answer(user_answer, question_data, document_context)
-                    # is_correct reste None, on se base sur le texte du feedback
+                    # Nouveau score calculé localement, écrit une seule fois dans la session
+                    new_score = ss[QUIZ_SCORE_KEY] + (1 if is_correct is True else 0)
+                    ss[QUIZ_SCORE_KEY] = new_score
 
-                # Stocker et afficher le feedback
-                st.session_state[QUIZ_FEEDBACK_KEY][current_index] = (is_correct, feedback_text)
-                if is_correct is True: st.success(feedback_text)
-                elif is_correct is False: st.error(feedback_text)
-                else: st.info(feedback_text) # Pour Ouvertes ou erreurs VF
+                # Stocker et afficher le feedback (les réponses ouvertes sont évaluées en un seul
+                # appel à l'IA à la fin du quiz, voir _evaluate_pending_open_answers)
+                if quiz_type != "Ouvertes":
+                    ss[QUIZ_FEEDBACK_KEY][current_index] = (is_correct, feedback_text)
+                    if is_correct is True: st.success(feedback_text)
+                    elif is_correct is False: st.error(feedback_text)
+                    else: st.info(feedback_text) # Erreurs VF
 
                 # Passer à la question suivante
-                st.session_state[QUIZ_CURRENT_QUESTION_KEY] += 1
-                st.rerun()
+                ss[QUIZ_CURRENT_QUESTION_KEY] += 1
+                _rerun_after_answer(ss[QUIZ_CURRENT_QUESTION_KEY], total_questions)
 
             except Exception as eval_e:
                  st.error(f"Erreur lors de l'évaluation/feedback : {eval_e}", icon="🆘")
-                 st.session_state[QUIZ_FEEDBACK_KEY][current_index] = (None, f"Erreur évaluation: {eval_e}")
-                 st.session_state[QUIZ_CURRENT_QUESTION_KEY] += 1
-                 st.rerun()
+                 ss[QUIZ_FEEDBACK_KEY][current_index] = (None, f"Erreur évaluation: {eval_e}")
+                 ss[QUIZ_CURRENT_QUESTION_KEY] += 1
+                 _rerun_after_answer(ss[QUIZ_CURRENT_QUESTION_KEY], total_questions)
         else:
             st.warning("Veuillez sélectionner ou entrer une réponse avant de valider.", icon="⚠️")
 
@@ -382,12 +606,15 @@ def display_quiz_interface():
 def display_quiz_results():
     """Affiche les résultats finaux du quiz."""
     st.subheader("🏁 Résultats du Quiz 🏁")
-    questions = st.session_state.get(QUIZ_QUESTIONS_KEY, [])
-    answers = st.session_state.get(QUIZ_ANSWERS_KEY, {})
-    feedback = st.session_state.get(QUIZ_FEEDBACK_KEY, {})
-    score = st.session_state.get(QUIZ_SCORE_KEY, 0)
+    # Appelée depuis display_quiz_interface(), après initialize_quiz_state()
+    ss = st.session_state
+    questions = ss[QUIZ_QUESTIONS_KEY]
+    answers = ss[QUIZ_ANSWERS_KEY]
+    feedback = ss[QUIZ_FEEDBACK_KEY]
+    score = ss[QUIZ_SCORE_KEY]
+    _evaluate_pending_open_answers(questions, answers, feedback, ss[DOCUMENT_CONTEXT_KEY], ss[DOCUMENT_HASH_KEY])
     total_questions = len(questions)
-    evaluated_questions = sum(1 for i, fb in feedback.items() if i < total_questions and fb[0] is not None) # QCM/VF évaluées
+    evaluated_questions = sum(1 for fb in feedback if fb is not None and fb[0] is not None) # QCM/VF évaluées
 
     if total_questions == 0:
          st.warning("Aucune question trouvée pour afficher les résultats.")
@@ -406,9 +633,9 @@ def display_quiz_results():
         q_text_short = question_data.get('question', f'Question {i+1}')[:60] + "..."
         with st.expander(f"Question {i+1}: {q_text_short}", expanded=False):
             st.markdown(f"**Question :** {question_data.get('question', 'N/A')}")
-            user_ans = answers.get(i, "*Non répondue*")
-            fb = feedback.get(i) # Tuple (is_correct, feedback_text)
-            q_type = detect_quiz_type(question_data)
+            user_ans = answers[i] if answers[i] is not None else "*Non répondue*"
+            fb = feedback[i] # Tuple (is_correct, feedback_text), ou None
+            q_type = get_question_type(question_data)
 
             # Affichage réponse utilisateur
             user_ans_display = "*Non répondue*"
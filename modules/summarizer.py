@@ -1,24 +1,191 @@
+import importlib.util
+import logging
+import re
 import streamlit as st
 from . import gemini_client
 from . import config
 from . import utils
 
+logger = logging.getLogger(__name__)
+
 # Limite de caractères pour l'aperçu du texte soumis à l'IA
 MAX_CONTEXT_PREVIEW = 500
 
-# @st.cache_data(show_spinner="Génération du résumé en cours...") # Mise en cache possible mais attention si le texte change
+# Phrases introductives parfois ajoutées par l'IA en tête du résumé (suivies d'un éventuel ':')
+_INTRO_RE = re.compile(r'^(?:voici un résumé|le résumé demandé est|en résumé,)\s*:*\s*', re.IGNORECASE)
+
+# Budget de tokens du document envoyé en un seul appel. Au-delà, le document est résumé par
+# morceaux (map), puis les résumés partiels sont eux-mêmes résumés (reduce) : la latence de
+# pré-remplissage et le coût d'un appel restent bornés, même pour un document de 100 MB.
+MAX_INPUT_TOKENS = 30000
+# Nombre moyen de caractères par token, utilisé si le comptage via l'API échoue
+CHARS_PER_TOKEN_ESTIMATE = 4
+# Taille de l'échantillon mesuré par l'API pour un long texte (résultat extrapolé au texte entier) :
+# la requête de comptage reste bornée, quelle que soit la taille du document
+TOKEN_COUNT_SAMPLE_CHARS = 100_000
+# Part du budget remplie par chaque morceau (marge pour les instructions et l'imprécision du découpage)
+CHUNK_FILL_RATIO = 0.9
+# Longueur maximale d'un résumé partiel et nombre de morceaux résumés en parallèle
+CHUNK_SUMMARY_MAX_OUTPUT_TOKENS = 1024
+MAP_MAX_WORKERS = 4
+
+# Compression optionnelle du document (LLMLingua-2) : supprime les tokens peu informatifs avant
+# l'appel à Gemini. La bibliothèque (et son modèle) n'est chargée que si l'option est activée.
+_LLMLINGUA_AVAILABLE = importlib.util.find_spec("llmlingua") is not None
+COMPRESSION_MODEL_NAME = "microsoft/llmlingua-2-xlm-roberta-large-meetingbank"
+COMPRESSION_RATE = 0.5 # Part des tokens conservés
+COMPRESSION_FORCE_TOKENS = ['\n', '.'] # Toujours conservés : structure des phrases et paragraphes
+
+@st.cache_resource(show_spinner="Chargement du modèle de compression...")
+def _get_prompt_compressor():
+    """Retourne le compresseur LLMLingua-2, chargé une seule fois par processus (None si indisponible)."""
+    try:
+        from llmlingua import PromptCompressor
+        return PromptCompressor(model_name=COMPRESSION_MODEL_NAME, use_llmlingua2=True)
+    except Exception as e:
+        st.warning(f"Compression du document indisponible : {e}", icon="⚠️")
+        return None
+
+def compress_text(text: str) -> str:
+    """
+    Compresse le texte avec LLMLingua-2 pour réduire le nombre de tokens envoyés à Gemini.
+
+    Args:
+        text (str): Le texte du document (sans les instructions du prompt).
+
+    Returns:
+        str: Le texte compressé, ou le texte d'origine si la compression est indisponible ou échoue.
+    """
+    compressor = _get_prompt_compressor() if _LLMLINGUA_AVAILABLE else None
+    if compressor is None:
+        return text
+    try:
+        result = compressor.compress_prompt(text, rate=COMPRESSION_RATE, force_tokens=COMPRESSION_FORCE_TOKENS)
+        return result['compressed_prompt'] or text
+    except Exception as e:
+        st.warning(f"Échec de la compression du document, envoi du texte complet : {e}", icon="⚠️")
+        return text
+
+def _build_summary_prompt(body: str, level: str, keywords: str | None, intro: str = "Voici un document :") -> str:
+    """Construit le prompt de résumé final (document complet ou concaténation des résumés partiels)."""
+    prompt_parts = [intro, "--- DEBUT DOCUMENT ---", body, "--- FIN DOCUMENT ---"]
+
+    # Ajouter les instructions de résumé
+    summary_instruction = config.SUMMARY_LEVELS.get(level, config.SUMMARY_LEVELS["Moyen"]) # Niveau par défaut si invalide
+    prompt_parts.append(f"\nInstructions : Génère {summary_instruction} de ce document.")
+
+    # Ajouter les mots-clés si fournis
+    if keywords:
+        prompt_parts.append(f"Le résumé doit se concentrer particulièrement sur les aspects liés à : '{keywords}'.")
+
+    prompt_parts.append("\nFormat de sortie attendu : Uniquement le texte du résumé.")
+    return "\n".join(prompt_parts)
+
+def count_text_tokens(text: str,
+                      model_name: str = config.DEFAULT_TEXT_MODEL_NAME,
+                      text_hash: str | None = None) -> int:
+    """
+    Compte les tokens d'un texte (résultat mis en cache par empreinte du texte).
+    Seuls les TOKEN_COUNT_SAMPLE_CHARS premiers caractères sont envoyés à l'API : pour un texte
+    plus long, le nombre de tokens est extrapolé au prorata du nombre de caractères.
+
+    Args:
+        text (str): Le texte à mesurer.
+        model_name (str): Le nom du modèle dont le tokenizer est utilisé.
+        text_hash (str | None): Empreinte du texte (`utils.content_hash`) si elle est déjà connue.
+
+    Returns:
+        int: Le nombre de tokens (estimé à partir du nombre de caractères si l'API échoue).
+    """
+    text_hash = text_hash or utils.content_hash(text)
+    sample = text[:TOKEN_COUNT_SAMPLE_CHARS]
+    sample_tokens = _count_sample_tokens_cached(text_hash, model_name, sample)
+    if sample_tokens is None:
+        # Échec non mémorisé : l'avertissement de count_tokens n'est pas rejoué par le cache
+        _count_sample_tokens_cached.clear(text_hash, model_name, sample)
+        return len(text) // CHARS_PER_TOKEN_ESTIMATE
+    if len(sample) == len(text):
+        return sample_tokens
+    return int(sample_tokens * len(text) / len(sample))
+
+@st.cache_data(show_spinner=False, max_entries=32)
+def _count_sample_tokens_cached(text_hash: str, model_name: str, _sample: str) -> int | None:
+    # L'échantillon est exclu du hachage de Streamlit (préfixe '_') : la clé est l'empreinte du texte
+    return gemini_client.count_tokens(_sample, model_name)
+
+def _split_into_chunks(text: str, chunk_chars: int) -> list[str]:
+    """
+    Découpe le texte en morceaux d'au plus `chunk_chars` caractères, coupés de préférence
+    sur un saut de ligne (sinon une espace) situé dans la seconde moitié du morceau.
+    """
+    chunks = []
+    start, n = 0, len(text)
+    while start < n:
+        end = min(start + chunk_chars, n)
+        if end < n:
+            floor = start + chunk_chars // 2
+            cut = text.rfind('\n', floor, end)
+            if cut == -1:
+                cut = text.rfind(' ', floor, end)
+            if cut != -1:
+                end = cut + 1
+        chunks.append(text[start:end])
+        start = end
+    return chunks
+
+def _summarize_chunks(text: str, num_tokens: int, keywords: str | None, model_name: str) -> str | None:
+    """
+    Étape "map" : résume chaque morceau du texte (appels parallèles) et concatène les résultats.
+
+    Args:
+        text (str): Le texte trop long pour un seul appel.
+        num_tokens (int): Son nombre de tokens (sert à convertir le budget en caractères).
+        keywords (str | None): Mots-clés optionnels pour orienter les résumés partiels.
+        model_name (str): Le nom du modèle Gemini à utiliser.
+
+    Returns:
+        str: Les résumés partiels, dans l'ordre du document, ou None si l'un d'eux a échoué.
+    """
+    # Conversion du budget en caractères selon le ratio caractères/tokens observé sur ce texte
+    chunk_chars = max(1, int(len(text) * MAX_INPUT_TOKENS * CHUNK_FILL_RATIO / num_tokens))
+    chunks = _split_into_chunks(text, chunk_chars)
+    focus = f" Conserve en priorité les éléments liés à : '{keywords}'." if keywords else ""
+
+    def _map_task(index: int, chunk: str):
+        prompt = (f"Voici la partie {index + 1}/{len(chunks)} d'un document :\n"
+                  f"--- DEBUT EXTRAIT ---\n{chunk}\n--- FIN EXTRAIT ---\n"
+                  f"\nInstructions : Résume fidèlement cet extrait en conservant les faits, chiffres et noms importants.{focus}"
+                  "\nFormat de sortie attendu : Uniquement le texte du résumé.")
+        return lambda: gemini_client.generate_text(prompt=prompt, model_name=model_name, temperature=0.2,
+                                                   max_output_tokens=CHUNK_SUMMARY_MAX_OUTPUT_TOKENS)
+
+    st.info(f"Document volumineux (~{num_tokens} tokens) : résumé en {len(chunks)} parties.", icon="✂️")
+    results = utils.run_concurrently({i: _map_task(i, chunk) for i, chunk in enumerate(chunks)},
+                                     max_workers=MAP_MAX_WORKERS)
+    partials = list(results.values())
+    if not all(partials):
+        return None
+    return "\n\n".join(f"[Partie {i + 1}] {partial.strip()}" for i, partial in enumerate(partials))
+
 def generate_summary(text: str,
                      level: str = "Moyen",
                      keywords: str | None = None,
-                     model_name: str = config.DEFAULT_TEXT_MODEL_NAME) -> str | None:
+                     model_name: str = config.DEFAULT_TEXT_MODEL_NAME,
+                     text_hash: str | None = None,
+                     compress: bool = False) -> str | None:
     """
     Génère un résumé du texte fourni en utilisant Gemini.
+    Un texte dépassant MAX_INPUT_TOKENS est d'abord résumé par morceaux (map-reduce).
+    Le résumé est mis en cache par empreinte du document et paramètres (sauf si l'option
+    "ignorer le cache" de la sidebar est activée).
 
     Args:
         text (str): Le texte à résumer.
         level (str): Le niveau de détail souhaité ("Court", "Moyen", "Long").
         keywords (str | None): Mots-clés optionnels pour orienter le résumé.
         model_name (str): Le nom du modèle Gemini à utiliser.
+        text_hash (str | None): Empreinte du texte (`utils.content_hash`) si elle est déjà connue.
+        compress (bool): Si True, le document est compressé (LLMLingua-2) avant l'envoi.
 
     Returns:
         str: Le résumé généré, ou None en cas d'erreur.
@@ -32,21 +199,66 @@ def generate_summary(text: str,
          st.error("Impossible de générer le résumé car le client Gemini n'est pas configuré.", icon="❌")
          return None
 
+    text_hash = text_hash or utils.content_hash(text)
+    if st.session_state.get(gemini_client.BYPASS_CACHE_KEY, False):
+        summary = _summarize(text, level, keywords, model_name, text_hash, compress)
+    else:
+        # Même document et mêmes options (ex. double clic) : ni nettoyage, ni comptage, ni appel à l'IA
+        summary = _summarize_cached(text_hash, level, keywords, model_name, compress, text)
+        if not summary:
+            # Streamlit mémorise la valeur au retour de la fonction : retirer uniquement cette entrée
+            _summarize_cached.clear(text_hash, level, keywords, model_name, compress, text)
 
-    # Construire le prompt pour Gemini
-    prompt_parts = ["Voici un document :", "--- DEBUT DOCUMENT ---", text, "--- FIN DOCUMENT ---"]
+    # Messages hors de la fonction en cache : affichés aussi lorsque le résumé vient du cache
+    if summary:
+        st.success("Résumé généré avec succès !", icon="📝")
+        return summary
+    # L'erreur est déjà loggée par gemini_client.generate_text
+    st.error("La génération du résumé a échoué.", icon="❌")
+    return None
 
-    # Ajouter les instructions de résumé
-    summary_instruction = config.SUMMARY_LEVELS.get(level, config.SUMMARY_LEVELS["Moyen"]) # Niveau par défaut si invalide
-    prompt_parts.append(f"\nInstructions : Génère {summary_instruction} de ce document.")
+@st.cache_data(show_spinner=False, ttl=3600, max_entries=64)
+def _summarize_cached(text_hash: str, level: str, keywords: str | None, model_name: str, compress: bool,
+                      _text: str) -> str | None:
+    """
+    Résumé mis en cache sur l'empreinte du document et les options (le texte est exclu du hachage).
+    Un échec (None) est retiré du cache par l'appelant, `generate_summary`.
+    """
+    return _summarize(_text, level, keywords, model_name, text_hash, compress)
 
-    # Ajouter les mots-clés si fournis
-    if keywords:
-        prompt_parts.append(f"Le résumé doit se concentrer particulièrement sur les aspects liés à : '{keywords}'.")
+def _summarize(text: str, level: str, keywords: str | None, model_name: str, text_hash: str | None,
+               compress: bool) -> str | None:
+    """Prépare le document (nettoyage, compression, map-reduce) et retourne le résumé nettoyé, sans cache."""
+    # Espaces superflus : des tokens payés sans information (les en-têtes/pieds de page des PDF sont
+    # déjà retirés à l'extraction, page par page). Les sauts de ligne sont conservés (découpage
+    # map-reduce sur les lignes, structure des paragraphes).
+    original_chars = len(text)
+    text = utils.clean_lines(text)
+    if len(text) != original_chars:
+        text_hash = None # L'empreinte fournie correspond au texte d'origine
+        logger.debug("Nettoyage du document : %d -> %d caractères (environ %d tokens économisés)",
+                     original_chars, len(text), (original_chars - len(text)) // CHARS_PER_TOKEN_ESTIMATE)
 
-    prompt_parts.append("\nFormat de sortie attendu : Uniquement le texte du résumé.")
+    if compress:
+        compressed = compress_text(text) # Seul le corps du document est compressé, pas les instructions
+        if compressed is not text:
+            text, text_hash = compressed, None
 
-    full_prompt = "\n".join(prompt_parts)
+    # Un token compte au moins un caractère : un texte plus court que le budget n'est pas mesuré
+    intro = "Voici un document :"
+    while len(text) > MAX_INPUT_TOKENS:
+        num_tokens = count_text_tokens(text, model_name, text_hash)
+        if num_tokens <= MAX_INPUT_TOKENS:
+            break
+        text = _summarize_chunks(text, num_tokens, keywords, model_name)
+        if text is None:
+            st.error("Le résumé d'une des parties du document a échoué.", icon="❌")
+            return None
+        text_hash = None # Le texte mesuré est désormais la concaténation des résumés partiels
+        intro = "Voici les résumés successifs des parties d'un document :"
+
+    # Construire le prompt pour Gemini
+    full_prompt = _build_summary_prompt(text, level, keywords, intro)
 
     # Afficher un aperçu du prompt (optionnel, pour le débogage)
     # with st.expander("Voir le prompt envoyé à l'IA"):
@@ -60,20 +272,10 @@ def generate_summary(text: str,
         max_output_tokens=1024 # Ajuster si nécessaire pour les résumés longs
     )
 
-    if summary:
-        st.success("Résumé généré avec succès !", icon="📝")
-        # Nettoyage simple (peut être amélioré)
-        summary = summary.strip()
-        # Supprimer les phrases introductives parfois ajoutées par l'IA
-        phrases_a_supprimer = ["Voici un résumé", "Le résumé demandé est", "En résumé,"]
-        for phrase in phrases_a_supprimer:
-            if summary.lower().startswith(phrase.lower()):
-                summary = summary[len(phrase):].strip().lstrip(':').strip()
-        return summary
-    else:
-        # L'erreur est déjà loggée par gemini_client.generate_text
-        st.error("La génération du résumé a échoué.", icon="❌")
+    if not summary:
         return None
+    # Nettoyage simple : supprimer en une passe la phrase introductive éventuelle
+    return _INTRO_RE.sub('', summary.strip(), count=1).strip() or None
 
 def display_summarizer_options(text_available: bool):
     """
@@ -83,16 +285,17 @@ def display_summarizer_options(text_available: bool):
         text_available (bool): Indique si du texte est disponible pour le résumé.
 
     Returns:
-        tuple: (level, keywords, summarize_button_pressed)
+        tuple: (level, keywords, compress, summarize_button_pressed)
                level (str): Niveau de résumé choisi.
                keywords (str): Mots-clés saisis.
+               compress (bool): True si la compression du document est activée.
                summarize_button_pressed (bool): True si le bouton "Générer Résumé" est cliqué.
     """
     st.subheader("2. Résumé Automatique")
 
     if not text_available:
         st.info("Chargez un document pour activer les options de résumé.", icon="📄")
-        return None, None, False
+        return None, None, False, False
 
     col1, col2 = st.columns([2, 3])
 
@@ -111,18 +314,27 @@ def display_summarizer_options(text_available: bool):
             key="summary_keywords"
         )
 
+    compress_document = st.toggle(
+        "Compresser le document avant l'envoi (LLMLingua-2)",
+        key="summary_compress_toggle",
+        disabled=not _LLMLINGUA_AVAILABLE,
+        help="Réduit le nombre de tokens envoyés à l'IA (résumé plus rapide et moins coûteux, légère perte de précision)."
+             + ("" if _LLMLINGUA_AVAILABLE else " Nécessite le paquet `llmlingua`.")
+    )
+
     summarize_button = st.button("Générer le Résumé", key="summarize_button", type="primary", use_container_width=True)
 
-    return summary_level, thematic_keywords, summarize_button
+    return summary_level, thematic_keywords, compress_document, summarize_button
 
 # Exemple d'intégration dans app.py :
 # if 'document_text' in st.session_state and st.session_state['document_text']:
-#     level, keywords, button_pressed = display_summarizer_options(text_available=True)
+#     level, keywords, compress, button_pressed = display_summarizer_options(text_available=True)
 #     if button_pressed:
 #         summary = generate_summary(
 #             st.session_state['document_text'],
 #             level=level,
-#             keywords=keywords
+#             keywords=keywords,
+#             compress=compress
 #         )
 #         if summary:
 #             st.session_state['current_summary'] = summary # Stocker pour affichage/export
@@ -0,0 +1,142 @@
+import functools
+import numpy as np
+from numba import njit, types
+from numba.typed import Dict
+
+# Noyaux Numba pour le comptage de mots (utilisés par analyzer.py si numba est installé).
+# Le texte est traité sous forme de buffer UTF-8 (uint8) : chaque mot est réduit à un
+# hash FNV-1a 64 bits, ce qui évite de créer un objet str Python par token.
+
+FNV_OFFSET = np.uint64(0xcbf29ce484222325)
+FNV_PRIME = np.uint64(0x100000001b3)
+
+
+def fnv1a_64(data: bytes) -> int:
+    """Hash FNV-1a 64 bits calculé côté Python (doit correspondre au noyau)."""
+    h = 0xcbf29ce484222325
+    for byte in data:
+        h ^= byte
+        h = (h * 0x100000001b3) & 0xFFFFFFFFFFFFFFFF
+    return h
+
+
+def build_stop_hashes(stopwords) -> np.ndarray:
+    """
+    Convertit un ensemble de mots vides en tableau trié de hashes FNV-1a.
+
+    Args:
+        stopwords: Itérable de mots vides (déjà en minuscules).
+
+    Returns:
+        np.ndarray: Tableau uint64 trié, utilisable pour une recherche dichotomique.
+    """
+    hashes = {fnv1a_64(word.encode('utf-8')) for word in stopwords}
+    return np.array(sorted(hashes), dtype=np.uint64)
+
+
+@functools.cache
+def build_word_table() -> np.ndarray:
+    """
+    Table indexée par point de code : 1 si le caractère appartient à \\w (str.isalnum() ou '_').
+
+    C'est exactement la classe utilisée par le repli regex d'analyzer.py (`[^\\w\\s]+`), ce qui
+    garantit les mêmes mots avec ou sans Numba (symboles et emoji compris). Calculée une seule fois.
+
+    Returns:
+        np.ndarray: Tableau uint8 de 0x110000 entrées.
+    """
+    return np.frombuffer(bytes(char.isalnum() or char == '_' for char in map(chr, range(0x110000))), dtype=np.uint8)
+
+
+@njit(cache=True, nogil=True) # nogil : peut tourner en parallèle d'autres threads (ex. appel Gemini)
+def tokenize_count(buf, stop_hashes, word_table):
+    """
+    Découpe un buffer UTF-8 (déjà en minuscules) en mots et compte leurs occurrences.
+
+    Tout caractère hors \\w (espace ou ponctuation) sépare les mots, comme
+    `re.sub(r'[^\\w\\s]+', ' ', ...).split()` ; les mots de 2 caractères ou moins
+    et les mots vides sont ignorés.
+
+    Args:
+        buf (np.ndarray[uint8]): Le texte encodé en UTF-8.
+        stop_hashes (np.ndarray[uint64]): Hashes triés des mots vides.
+        word_table (np.ndarray[uint8]): Caractères de mot, par point de code (voir `build_word_table`).
+
+    Returns:
+        tuple: (counts, starts, ends) — pour chaque mot unique (dans l'ordre de première
+               apparition), son nombre d'occurrences et la position de sa première occurrence.
+    """
+    index = Dict.empty(key_type=types.uint64, value_type=types.int64)
+    # Listes natives Numba (typées à la compilation) : croissance amortie sans réallouer les tableaux
+    counts = [np.int64(0) for _ in range(0)]
+    starts = [np.int64(0) for _ in range(0)]
+    ends = [np.int64(0) for _ in range(0)]
+    n_unique = 0
+    n_stop = stop_hashes.shape[0]
+    n_table = word_table.shape[0]
+
+    n = buf.shape[0]
+    h = FNV_OFFSET
+    n_chars = 0
+    start = 0
+    i = 0
+    while i <= n:
+        width = 1
+        cp = 32
+        if i < n:
+            b = int(buf[i])
+            if b >= 0xF0 and i + 3 < n:
+                cp = ((b & 0x07) << 18) | ((int(buf[i + 1]) & 0x3F) << 12) | ((int(buf[i + 2]) & 0x3F) << 6) | (int(buf[i + 3]) & 0x3F)
+                width = 4
+            elif b >= 0xE0 and i + 2 < n:
+                cp = ((b & 0x0F) << 12) | ((int(buf[i + 1]) & 0x3F) << 6) | (int(buf[i + 2]) & 0x3F)
+                width = 3
+            elif b >= 0xC0 and i + 1 < n:
+                cp = ((b & 0x1F) << 6) | (int(buf[i + 1]) & 0x3F)
+                width = 2
+            else:
+                cp = b
+
+        if cp >= n_table or word_table[cp] == 0:
+            if n_chars > 2:
+                pos = np.searchsorted(stop_hashes, h)
+                if pos >= n_stop or stop_hashes[pos] != h:
+                    if h in index:
+                        idx = index[h]
+                    else:
+                        idx = n_unique
+                        index[h] = idx
+                        counts.append(0)
+                        starts.append(start)
+                        ends.append(i)
+                        n_unique += 1
+                    counts[idx] += 1
+            h = FNV_OFFSET
+            n_chars = 0
+        else:
+            if n_chars == 0:
+                start = i
+            for k in range(width):
+                h ^= np.uint64(buf[i + k])
+                h *= FNV_PRIME
+            n_chars += 1
+        i += width
+
+    return np.array(counts, dtype=np.int64), np.array(starts, dtype=np.int64), np.array(ends, dtype=np.int64)
+
+
+def count_words(text: str, stop_hashes: np.ndarray) -> tuple[list[str], np.ndarray]:
+    """
+    Compte les mots du texte (hors mots vides et mots courts) via le noyau `tokenize_count`.
+
+    Args:
+        text (str): Le texte source.
+        stop_hashes (np.ndarray): Hashes des mots vides (voir `build_stop_hashes`).
+
+    Returns:
+        tuple: (mots uniques dans l'ordre de première apparition, tableau int64 de leurs occurrences).
+    """
+    data = text.lower().encode('utf-8', 'ignore')
+    counts, starts, ends = tokenize_count(np.frombuffer(data, dtype=np.uint8), stop_hashes, build_word_table())
+    words = [data[start:end].decode('utf-8', 'ignore') for start, end in zip(starts.tolist(), ends.tolist())]
+    return words, counts
@@ -1,66 +1,213 @@
-import PyPDF2
-import docx
 import json
+import orjson
 import io
-import streamlit as st
+import codecs
+import os
+import hashlib
+import functools
+import shutil
+import subprocess
+import tempfile
+import threading
+import itertools
+import multiprocessing
+import logging
 import re
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+import streamlit as st
+from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
+from . import pdf_pages
+
+logger = logging.getLogger(__name__)
+
+def _as_stream(file_content):
+    """Retourne un flux binaire positionné au début (les bytes sont enveloppés sans copie supplémentaire)."""
+    if isinstance(file_content, (bytes, bytearray, memoryview)):
+        return io.BytesIO(file_content)
+    file_content.seek(0)
+    return file_content
+
+def _as_bytes(file_content) -> bytes:
+    """Retourne le contenu sous forme de bytes (lu depuis le début s'il s'agit d'un flux)."""
+    if isinstance(file_content, bytes):
+        return file_content
+    if isinstance(file_content, (bytearray, memoryview)):
+        return bytes(file_content)
+    file_content.seek(0)
+    return file_content.read()
+
+# Les extracteurs acceptent des bytes ou un flux binaire (ex: l'UploadedFile de Streamlit, lu
+# directement sans copie intégrale via getvalue()). Ils ne sont pas mis en cache individuellement :
+# loader._extract_text_cached mémorise déjà le texte par empreinte du document.
+# PyPDF2 et python-docx sont importés au premier appel de leur extracteur (démarrage plus rapide).
+# Binaire Poppler `pdftotext`, résolu une seule fois (None s'il n'est pas dans le PATH)
+_PDFTOTEXT_PATH = shutil.which("pdftotext")
+PDFTOTEXT_TIMEOUT_SECONDS = 30
+
+def _extract_pdf_text_pdftotext(file_content) -> str | None:
+    """
+    Extrait le texte d'un PDF avec le binaire natif `pdftotext` (Poppler).
+
+    Returns:
+        Le texte extrait, ou None si l'outil échoue (le PDF est alors traité par les autres extracteurs).
+    """
+    tmp_path = None
+    try:
+        # Fichier fermé avant l'appel (et supprimé ensuite) : lisible par un autre processus, y compris sous Windows
+        with tempfile.NamedTemporaryFile(suffix=".pdf", delete=False) as tmp:
+            tmp_path = tmp.name
+            shutil.copyfileobj(_as_stream(file_content), tmp)
+        proc = subprocess.run([_PDFTOTEXT_PATH, "-q", "-enc", "UTF-8", tmp_path, "-"],
+                              capture_output=True, timeout=PDFTOTEXT_TIMEOUT_SECONDS)
+        if proc.returncode != 0:
+            return None
+        # Pages séparées par un saut de page (\f) : même séparateur que les autres extracteurs
+        pages = remove_running_headers(proc.stdout.decode("utf-8", errors="replace").split("\f"))
+        return "\n\n".join(page.strip("\n") for page in pages if page.strip()).strip()
+    except (OSError, subprocess.SubprocessError):
+        return None
+    finally:
+        if tmp_path:
+            try:
+                os.unlink(tmp_path)
+            except OSError:
+                pass
+
+@functools.cache
+def _get_pymupdf():
+    """Module PyMuPDF (fitz), optionnel : None s'il n'est pas installé (repli sur PyPDF2)."""
+    try:
+        import fitz
+    except ImportError:
+        return None
+    return fitz
+
+# Extraction PyMuPDF parallèle (par plages de pages) au-delà de ce nombre de pages : le démarrage
+# des processus fils n'est amorti que sur les gros documents
+PDF_PARALLEL_MIN_PAGES = 64
+PDF_PARALLEL_MAX_WORKERS = 8
+
+def _pymupdf_pages_text_parallel(file_content, page_count: int, workers: int) -> list[str] | None:
+    """
+    Extrait le texte des pages en parallèle, une plage contiguë de pages par processus.
+    PyMuPDF n'est pas thread-safe : chaque processus ouvre sa propre copie du document, depuis
+    un fichier temporaire écrit une seule fois (seul son chemin est transmis aux processus).
+
+    Returns:
+        Le texte de chaque page (dans l'ordre), ou None si le pool de processus a échoué.
+    """
+    bounds = [page_count * k // workers for k in range(workers + 1)]
+    tmp_path = None
+    try:
+        with tempfile.NamedTemporaryFile(suffix=".pdf", delete=False) as tmp:
+            tmp_path = tmp.name
+            shutil.copyfileobj(_as_stream(file_content), tmp)
+        # 'spawn' : ne pas dupliquer par fork un processus Streamlit multi-thread. Les processus
+        # n'importent que pdf_pages (sans Streamlit).
+        with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn")) as executor:
+            chunks = executor.map(pdf_pages.pages_text, itertools.repeat(tmp_path), bounds[:-1], bounds[1:])
+            return [page_text for chunk in chunks for page_text in chunk]
+    except Exception:
+        logger.exception("Échec de l'extraction PDF parallèle (%d pages), repli sur l'extraction séquentielle", page_count)
+        return None
+    finally:
+        if tmp_path:
+            try:
+                os.unlink(tmp_path)
+            except OSError:
+                pass
 
-@st.cache_data(show_spinner=False) # Cache le résultat pour éviter de re-extraire à chaque rerun
-def extract_text_from_pdf(file_content: bytes) -> str:
+def extract_text_from_pdf(file_content) -> str:
     """
-    Extrait le texte d'un fichier PDF fourni sous forme de bytes.
+    Extrait le texte d'un fichier PDF fourni sous forme de bytes ou de flux binaire.
+    Utilise par ordre de préférence le binaire `pdftotext` (Poppler) s'il est dans le PATH,
+    PyMuPDF (analyseur en C) s'il est installé, sinon PyPDF2.
 
     Args:
-        file_content: Le contenu binaire du fichier PDF.
+        file_content: Le contenu binaire du fichier PDF (bytes ou flux).
 
     Returns:
         Le texte extrait du PDF, ou une chaîne vide en cas d'erreur.
     """
+    if _PDFTOTEXT_PATH:
+        text = _extract_pdf_text_pdftotext(file_content)
+        if text:
+            return text
+
+    fitz = _get_pymupdf()
+    if fitz is not None:
+        try:
+            document = fitz.open(stream=_as_stream(file_content), filetype="pdf")
+            try:
+                page_texts = None
+                workers = min(PDF_PARALLEL_MAX_WORKERS, os.cpu_count() or 1)
+                if document.page_count >= PDF_PARALLEL_MIN_PAGES and workers > 1:
+                    page_texts = _pymupdf_pages_text_parallel(file_content, document.page_count, workers)
+                if page_texts is None: # Petit document, un seul cœur ou échec du pool : extraction séquentielle
+                    page_texts = [page.get_text("text") for page in document]
+            finally:
+                document.close()
+            # Pages non vides séparées par une ligne blanche, comme avec PyPDF2
+            page_texts = remove_running_headers(page_texts)
+            return "\n\n".join([page_text for page_text in page_texts if page_text]).strip()
+        except Exception as e:
+            st.error(f"Erreur lors de l'extraction du texte PDF : {e}", icon="📄")
+            return ""
+
     try:
-        pdf_reader = PyPDF2.PdfReader(io.BytesIO(file_content))
-        text = ""
+        import PyPDF2
+        pdf_reader = PyPDF2.PdfReader(_as_stream(file_content))
+        parts: list[str] = [] # Une seule concaténation finale (pas de `text +=` par page)
         for page in pdf_reader.pages:
             page_text = page.extract_text()
             if page_text: # S'assurer que du texte a été extrait
-                text += page_text + "\n\n" # Ajouter un saut de ligne entre les pages
-        return text.strip()
+                parts.append(page_text)
+        return "\n\n".join(remove_running_headers(parts)).strip() # Ligne blanche entre les pages
     except Exception as e:
         st.error(f"Erreur lors de l'extraction du texte PDF : {e}", icon="📄")
         return ""
 
-@st.cache_data(show_spinner=False)
-def extract_text_from_docx(file_content: bytes) -> str:
+def extract_text_from_docx(file_content) -> str:
     """
-    Extrait le texte d'un fichier DOCX fourni sous forme de bytes.
+    Extrait le texte d'un fichier DOCX fourni sous forme de bytes ou de flux binaire.
 
     Args:
-        file_content: Le contenu binaire du fichier DOCX.
+        file_content: Le contenu binaire du fichier DOCX (bytes ou flux).
 
     Returns:
         Le texte extrait du DOCX, ou une chaîne vide en cas d'erreur.
     """
     try:
-        document = docx.Document(io.BytesIO(file_content))
-        text = "\n".join([paragraph.text for paragraph in document.paragraphs])
-        return text.strip()
+        import docx
+        document = docx.Document(_as_stream(file_content))
+        # `paragraph.text` reconstruit le texte à partir des runs XML : lu une seule fois par paragraphe.
+        # Liste plutôt que générateur : str.join matérialise de toute façon son argument en liste.
+        texts = [text for paragraph in document.paragraphs if (text := paragraph.text)] # Paragraphes vides ignorés
+        return "\n".join(texts).strip()
     except Exception as e:
         st.error(f"Erreur lors de l'extraction du texte DOCX : {e}", icon="📄")
         return ""
 
-@st.cache_data(show_spinner=False)
-def extract_text_from_txt(file_content: bytes, encoding='utf-8') -> str:
+def extract_text_from_txt(file_content, encoding='utf-8') -> str:
     """
-    Extrait le texte d'un fichier TXT fourni sous forme de bytes.
+    Extrait le texte d'un fichier TXT fourni sous forme de bytes ou de flux binaire.
     Tente de décoder en UTF-8, puis en latin-1 si l'UTF-8 échoue.
 
     Args:
-        file_content: Le contenu binaire du fichier TXT.
+        file_content: Le contenu binaire du fichier TXT (bytes ou flux).
         encoding: L'encodage initial à essayer (par défaut 'utf-8').
 
     Returns:
         Le texte extrait du TXT, ou une chaîne vide en cas d'erreur.
     """
+    file_content = _as_bytes(file_content) # Le décodage porte sur l'ensemble du contenu
     try:
+        if encoding == 'utf-8':
+            if file_content.startswith(codecs.BOM_UTF8): # BOM UTF-8 (Bloc-notes Windows) : retiré du texte
+                return file_content.decode('utf-8-sig').strip()
+            if file_content.isascii(): # Cas courant : un seul balayage en C, sans validation UTF-8
+                return file_content.decode('ascii').strip()
         return file_content.decode(encoding).strip()
     except UnicodeDecodeError:
         st.warning(f"Impossible de décoder le fichier TXT en {encoding}, tentative avec 'latin-1'...", icon="⚠️")
@@ -73,22 +220,35 @@ def extract_text_from_txt(file_content: bytes, encoding='utf-8') -> str:
         st.error(f"Erreur lors de l'extraction du texte TXT : {e}", icon="📄")
         return ""
 
-@st.cache_data(show_spinner=False)
-def extract_text_from_json(file_content: bytes) -> str:
+# Un JSON sans ligne indentée dans ses premiers caractères est considéré comme minifié
+# (un simple saut de ligne final ne suffit pas à le considérer comme formaté)
+JSON_MINIFIED_PROBE_CHARS = 1024
+
+def extract_text_from_json(file_content) -> str:
     """
-    Extrait le texte d'un fichier JSON fourni sous forme de bytes.
-    Convertit la structure JSON en une chaîne de caractères formatée.
+    Extrait le texte d'un fichier JSON fourni sous forme de bytes ou de flux binaire.
+    Un JSON déjà indenté est renvoyé tel quel (après validation) ; un JSON minifié est
+    reformaté avec indentation pour rester lisible.
 
     Args:
-        file_content: Le contenu binaire du fichier JSON.
+        file_content: Le contenu binaire du fichier JSON (bytes ou flux).
 
     Returns:
         Une représentation textuelle du JSON, ou une chaîne vide en cas d'erreur.
     """
     try:
-        # D'abord, décoder les bytes en chaîne
-        json_string = file_content.decode('utf-8')
-        data = json.loads(json_string)
+        raw = _as_bytes(file_content)
+        try:
+            # orjson (C, SIMD) : valide les bytes (JSON et UTF-8) sans passer par un str intermédiaire
+            data = orjson.loads(raw)
+            text = raw.decode('utf-8')
+            probe = text.lstrip()[:JSON_MINIFIED_PROBE_CHARS]
+            if '\n ' in probe or '\n\t' in probe:
+                return text.strip() # Déjà formaté : inutile de re-sérialiser la structure
+            return orjson.dumps(data, option=orjson.OPT_INDENT_2).decode('utf-8').strip()
+        except (orjson.JSONDecodeError, orjson.JSONEncodeError):
+            pass # Cas refusés par orjson (BOM UTF-8, NaN/Infinity...) : bibliothèque standard
+        data = json.loads(raw)
         text = json.dumps(data, indent=2, ensure_ascii=False)
         return text.strip()
     except json.JSONDecodeError as e:
@@ -112,12 +272,87 @@ def clean_text(text: str) -> str:
     """
     if not isinstance(text, str):
         return ""
-    # Remplace les multiples espaces/sauts de ligne par un seul espace
-    text = re.sub(r'\s+', ' ', text)
-    # Supprime les espaces en début et fin de chaîne
-    text = text.strip()
-    return text
+    # Texte déjà normalisé : tout blanc autre que l'espace ASCII (\n, \t, espace insécable...) est
+    # non imprimable, donc sans double espace ni caractère non imprimable il n'y a rien à fusionner
+    if '  ' not in text and text.isprintable():
+        return text.strip()
+    # Remplace les multiples espaces/sauts de ligne par un seul espace et supprime ceux des extrémités.
+    # str.split() sans argument coupe sur les mêmes caractères que \s (espace insécable compris), en C.
+    return " ".join(text.split())
+
+def clean_lines(text: str) -> str:
+    """
+    Comme `clean_text`, mais ligne par ligne : les blancs sont fusionnés à l'intérieur de chaque
+    ligne et les lignes vides supprimées, les sauts de ligne (structure du document) sont conservés.
+
+    Args:
+        text: Le texte brut à nettoyer.
+
+    Returns:
+        Le texte nettoyé, une ligne non vide par ligne d'origine.
+    """
+    if not isinstance(text, str):
+        return ""
+    return "\n".join([line for raw_line in text.splitlines() if (line := " ".join(raw_line.split()))])
+
+# En-têtes/pieds de page répétés (extraction PDF) : détectés page par page, sur les premières et
+# dernières lignes de chaque page uniquement. Une ligne est retirée si elle revient sur plus de la
+# moitié des pages (et au moins BOILERPLATE_MIN_PAGES pages). Les lignes courtes, sans lettre
+# (nombres, cellules de tableau, ponctuation) ou longues ne sont jamais considérées comme gabarit.
+BOILERPLATE_MIN_PAGES = 3
+BOILERPLATE_EDGE_LINES = 3 # Lignes examinées en haut et en bas de chaque page
+BOILERPLATE_MIN_LINE_CHARS = 8
+BOILERPLATE_MAX_LINE_CHARS = 120
+# Seuls les numéros de page en début ou fin de ligne sont neutralisés ("Page 3 / 10" et "Page 4 / 10"
+# comptent pour une même ligne) ; les autres chiffres distinguent les lignes (tableaux, listes)
+_PAGE_NUMBER = r'(?:page|p\.)\s*\d+(?:\s*(?:/|sur|of)\s*\d+)?'
+_PAGE_NUMBER_RE = re.compile(rf'^{_PAGE_NUMBER}\b|\b{_PAGE_NUMBER}$', re.IGNORECASE)
+
+def _boilerplate_key(line: str) -> str | None:
+    """Clé de comparaison d'une ligne, ou None si elle ne peut pas être un en-tête/pied de page."""
+    line = line.strip()
+    if _PAGE_NUMBER_RE.fullmatch(line):
+        return 'page #' # Pied de page "Page 3 / 10", quelle que soit sa longueur
+    if not BOILERPLATE_MIN_LINE_CHARS <= len(line) <= BOILERPLATE_MAX_LINE_CHARS:
+        return None
+    if not any(char.isalpha() for char in line):
+        return None # Nombre, cellule de tableau, ponctuation : du contenu, pas un gabarit
+    return _PAGE_NUMBER_RE.sub('page #', line)
+
+def remove_running_headers(pages: list[str]) -> list[str]:
+    """
+    Supprime les en-têtes et pieds de page répétés d'un PDF, à partir du texte de chaque page.
 
+    Args:
+        pages: Le texte de chaque page, dans l'ordre (avec ses sauts de ligne).
+
+    Returns:
+        Le texte des pages sans ces lignes (liste inchangée si aucune n'est détectée).
+    """
+    if len(pages) < BOILERPLATE_MIN_PAGES:
+        return pages
+
+    page_lines = [page.splitlines() for page in pages]
+    page_keys = []
+    counts = Counter()
+    for lines in page_lines:
+        edges = {}
+        candidates = [i for i, line in enumerate(lines) if line.strip()]
+        for i in candidates[:BOILERPLATE_EDGE_LINES] + candidates[-BOILERPLATE_EDGE_LINES:]:
+            key = _boilerplate_key(lines[i])
+            if key is not None:
+                edges[i] = key
+        page_keys.append(edges)
+        counts.update(set(edges.values())) # Une occurrence au plus par page
+
+    min_pages = max(BOILERPLATE_MIN_PAGES, len(pages) // 2 + 1)
+    repeated = {key for key, count in counts.items() if count >= min_pages}
+    if not repeated:
+        return pages
+    return ["\n".join([line for i, line in enumerate(lines) if edges.get(i) not in repeated])
+            for lines, edges in zip(page_lines, page_keys)]
+
+@functools.lru_cache(maxsize=256)
 def get_file_extension(filename: str) -> str | None:
     """
     Retourne l'extension d'un nom de fichier en minuscules.
@@ -128,9 +363,58 @@ def get_file_extension(filename: str) -> str | None:
     Returns:
         L'extension du fichier (ex: 'pdf', 'docx') ou None si pas d'extension.
     """
-    if '.' in filename:
-        return filename.rsplit('.', 1)[1].lower()
-    return None
+    # Un seul appel C, sans liste intermédiaire (même découpage que loader.extract_text_from_uploaded_file)
+    _, dot, extension = filename.rpartition('.')
+    return extension.lower() if dot else None
+
+def content_hash(data: str | bytes) -> str:
+    """
+    Calcule une empreinte BLAKE2b (128 bits) d'un texte ou de données binaires.
+    Utilisée comme clé de cache compacte à la place du contenu complet d'un document.
+
+    Args:
+        data: Le texte (encodé en UTF-8) ou les bytes à hacher.
+
+    Returns:
+        L'empreinte hexadécimale (32 caractères).
+    """
+    if isinstance(data, str):
+        data = data.encode('utf-8', 'surrogatepass')
+    return hashlib.blake2b(data, digest_size=16).hexdigest()
+
+def run_concurrently(tasks: dict, max_workers: int = 4) -> dict:
+    """
+    Exécute des tâches indépendantes dans des threads et retourne leurs résultats.
+    Permet de recouvrir les attentes réseau (appels Gemini) avec les calculs locaux.
+    Le contexte Streamlit est transmis aux threads pour que leurs messages (st.*) s'affichent.
+
+    Args:
+        tasks: Dictionnaire {nom: fonction sans argument}.
+        max_workers: Nombre maximum de threads simultanés.
+
+    Returns:
+        Dictionnaire {nom: résultat}, dans l'ordre des tâches. Une tâche en erreur vaut None.
+    """
+    if len(tasks) <= 1: # Pas de gain à paralléliser une seule tâche
+        return {name: fn() for name, fn in tasks.items()}
+
+    ctx = get_script_run_ctx()
+
+    def _run(fn):
+        add_script_run_ctx(threading.current_thread(), ctx)
+        return fn()
+
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(tasks))) as executor:
+        futures = {name: executor.submit(_run, fn) for name, fn in tasks.items()}
+
+    results = {}
+    for name, future in futures.items():
+        try:
+            results[name] = future.result()
+        except Exception as e:
+            st.error(f"Erreur lors de l'exécution de la tâche '{name}' : {e}", icon="🔥")
+            results[name] = None
+    return results
 
 # --- Fonctions de test ---
 
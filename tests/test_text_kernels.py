@@ -0,0 +1,29 @@
+import pytest
+
+pytest.importorskip("numba")
+
+from modules import analyzer, text_kernels
+
+MIXED_TEXT = ("😀emoji café « naïve » déjà-vu l’été ∑somme ™marque №numéro ①cercle ²carré "
+              "snake_case ŒUVRE 東京タワー Ελληνικά القاهرة ½moitié ℃degré → flèche 🇫🇷drapeau "
+              "mot insécable zéro​joint tab\tfin emoji😀 café")
+
+
+def _counts(monkeypatch, kernels, text_hash):
+    monkeypatch.setattr(analyzer, "_get_text_kernels", lambda: kernels)
+    words, counts = analyzer._count_words_cached(text_hash, MIXED_TEXT)
+    return dict(zip(words, counts.tolist()))
+
+
+def test_numba_kernel_matches_regex_fallback_on_mixed_unicode(monkeypatch):
+    numba_counts = _counts(monkeypatch, text_kernels, "parity-numba")
+    regex_counts = _counts(monkeypatch, None, "parity-regex")
+    assert numba_counts == regex_counts
+    assert numba_counts["emoji"] == 2 and numba_counts["café"] == 2
+
+
+def test_word_table_matches_regex_word_class():
+    import re
+    table = text_kernels.build_word_table()
+    word_re = re.compile(r"\w")
+    assert all(bool(table[cp]) == bool(word_re.match(chr(cp))) for cp in range(0x3000))
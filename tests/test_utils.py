@@ -0,0 +1,61 @@
+from modules import utils
+
+
+def _pages(build, count=4):
+    return [build(i) for i in range(1, count + 1)]
+
+
+def test_running_headers_and_page_numbers_are_removed():
+    pages = _pages(lambda i: f"Rapport annuel - Société X\nContenu propre à la page {'abcd'[i - 1]}.\nPage {i} / 4")
+    assert utils.remove_running_headers(pages) == [f"Contenu propre à la page {c}." for c in "abcd"]
+
+
+def test_table_rows_differing_by_numbers_are_kept():
+    pages = _pages(lambda i: f"T{i}\n{100 + 15 * i}\nTotal du trimestre : {1000 + i} euros\n{i}")
+    assert utils.remove_running_headers(pages) == pages
+
+
+def test_numbered_list_is_kept():
+    pages = _pages(lambda i: f"Étape {i} : préparer le lot\n{i}.\nÉtape {i + 1} : vérifier le lot")
+    assert utils.remove_running_headers(pages) == pages
+
+
+def test_short_or_symbol_only_repeated_lines_are_kept():
+    pages = _pages(lambda i: f"* * *\nSuite\nCorps {'abcd'[i - 1]}\n— 2024 —")
+    assert utils.remove_running_headers(pages) == pages
+
+
+def test_repeats_on_half_of_the_pages_or_less_are_kept():
+    pages = _pages(lambda i: ("Chapitre premier\n" if i <= 2 else "") + f"Texte {'abcd'[i - 1]}")
+    assert utils.remove_running_headers(pages) == pages
+
+
+def test_repeats_in_the_middle_of_pages_are_kept():
+    body = "\n".join(f"ligne {c}" for c in "abcdefgh")
+    pages = _pages(lambda i: f"Début {'abcd'[i - 1]}\n{body}\nLigne répétée au milieu\n{body}\nFin {'abcd'[i - 1]}")
+    assert utils.remove_running_headers(pages) == pages
+
+
+def test_too_few_pages_are_unchanged():
+    pages = ["En-tête commun\nUn", "En-tête commun\nDeux"]
+    assert utils.remove_running_headers(pages) == pages
+
+
+def test_clean_lines_keeps_line_breaks():
+    assert utils.clean_lines(" a  b \n\n\t\nc\td \r\n  e ") == "a b\nc d\ne"
+
+
+def test_page_numbers_are_collapsed_only_at_line_edges():
+    pages = _pages(lambda i: f"Page {i} - Rapport technique\nCorps {'abcd'[i - 1]}\nVoir la page {i} pour le détail\nSociété X, p. {i} sur 4")
+    assert utils.remove_running_headers(pages) == [f"Corps {c}\nVoir la page {i} pour le détail"
+                                                   for i, c in enumerate("abcd", start=1)]
+
+
+def test_minified_json_with_trailing_newline_is_indented():
+    assert utils.extract_text_from_json(b'{"a":1,"b":[1,2]}\n') == '{\n  "a": 1,\n  "b": [\n    1,\n    2\n  ]\n}'
+
+
+def test_indented_json_is_returned_as_is():
+    raw = '{\n    "a": [1,\n        2]\n}\n'
+    assert utils.extract_text_from_json(raw.encode()) == raw.strip()
+    assert utils.extract_text_from_json(raw.replace("    ", "\t").encode()) == raw.replace("    ", "\t").strip()